@@ -0,0 +1,41 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import ld
+from stories import DE
+from utils import regression
+
+summary = pd.read_pickle(ld.TXGROUP_SUMMARY)
+motifs = summary.filter(like='cluster').columns
+contrasts = [(ifn, control) for ifn in DE.IFNS for control in ['mock'] if ifn != control]
+
+# All contrasts are fitted together, so targets must be shared: expressed in at least one of the conditions
+mask = np.zeros(len(summary), dtype=bool)
+for ifn, control in contrasts:
+    mask |= (summary[(ifn, 'TPM')] >= ld.thresholds.min_tpm) | (summary[(control, 'TPM')] >= ld.thresholds.min_tpm)
+print(f"Fitting motif activities for {len(contrasts)} contrasts with {mask.sum()} ({mask.mean():.1%}) targets")
+
+responses = summary[motifs][mask].to_numpy()
+lfc = np.column_stack([summary[(ifn, control, 'log2FoldChange')][mask].to_numpy() for ifn, control in contrasts])
+fit = regression.fit(
+    responses, lfc, ld.regression.penalties, l1ratio=ld.regression.l1ratio, folds=ld.regression.folds,
+    seed=ld.regression.seed
+)
+
+results = []
+for col, (ifn, control) in enumerate(contrasts):
+    print(f"{ifn} vs {control}: penalty {fit.penalty[col]:.2e}, CV MSE {fit.cv.min(axis=0)[col]:.3f}")
+    zscores = fit.coef[:, col] / fit.se[:, col]
+    results.append(pd.DataFrame({
+        'motif': [motif[1] for motif in motifs], 'target': ifn, 'control': control,
+        'Coefficient': fit.coef[:, col], 'SE': fit.se[:, col], 'Z-score': zscores,
+        'p-value': 2 * stats.norm.sf(np.abs(zscores)), 'Penalty': fit.penalty[col],
+    }))
+
+# Motif activity per standard deviation of the cluster response, adjusted for all other clusters
+df = pd.concat(results, ignore_index=True)
+ld.MOTIF_ACTIVITY.parent.mkdir(parents=True, exist_ok=True)
+df.to_pickle(ld.MOTIF_ACTIVITY, protocol=pickle.HIGHEST_PROTOCOL)
@@ -5,9 +5,42 @@ RESULTS = ROOT / "results"
 
 TXGROUP_SUMMARY = RESULTS / "txgroup_summary.pkl"
 STAT_TESTS = RESULTS / "stat_tests.pkl"
+THRESHOLD_SWEEP = RESULTS / "threshold_sweep.pkl"
+MOTIF_ACTIVITY = RESULTS / "motif_activity.pkl"
 
 
 class thresholds:
     min_tpm = 10.0  # Minimum TPM for a transcript to be considered expressed
     zscore = (-1, 2)  # (lower, upper) bounds for z-score
     qvalue = 0.01
+    # Grid of (lower, upper) z-score bounds for the robustness analysis
+    sweep = (
+        (-2.0, -1.5, -1.0, -0.5, 0.0),
+        (1.0, 1.5, 2.0, 2.5, 3.0),
+    )
+
+
+class aggregation:
+    # Promoter responses are aggregated per transcript group with one of: max, mean, weighted. The weighted mean uses
+    # the average TPM of each promoter's transcripts across mock samples.
+    reducer = "max"
+    baseline = "mock"
+
+
+class permutations:
+    # Empirical p-values: log2FC values are shuffled within strata, either DESeq2 partitions ("partition") or
+    # quantile bins of baseline TPM ("expression")
+    count = 10_000
+    batchsize = 256
+    seed = 42
+    strata = "partition"
+    bins = 10
+
+
+class regression:
+    # log2FC of all contrasts regressed on all cluster responses: ridge (l1ratio = 0) or elastic net. The penalty is
+    # selected for each contrast by cross-validation.
+    penalties = tuple(10 ** (x / 4) for x in range(-20, 5))
+    l1ratio = 0.0
+    folds = 5
+    seed = 42
@@ -1,21 +1,41 @@
+import numpy as np
 import pandas as pd
 
 import ld
 from stories.DE import DESeq2, IFNS
 from stories.JASPAR import scoring
-from stories.terminus import TX2GROUP
+from stories.terminus import SALMON, TX2GROUP
+from utils import Incidence
 
 TX2GROUP = pd.read_csv(TX2GROUP, sep='\t', index_col=0)['group'].to_dict()
 
-# Match transcript responses to groups
-responses = scoring.clusters().drop(columns=['seqid', 'roi-norm-start', 'roi-norm-end', 'is-reference'])
-responses['ID'] = responses['Transcript ID'].apply(
-    lambda alltids: {TX2GROUP[tid] for tid in alltids if tid in TX2GROUP}
-)
-responses = responses[responses['ID'].apply(len) > 0].drop(columns=['Transcript ID']).copy()
-responses = responses.explode('ID')
+annotation, matrix = scoring.clusters()
+clusters, _ = matrix.motifs()
+
+# Transcript-level TPMs averaged across baseline samples (only needed for the weighted mean)
+tpms = {}
+if ld.aggregation.reducer == "weighted":
+    quants = [
+        pd.read_csv(quant, sep='\t', usecols=['Name', 'TPM'], index_col='Name')['TPM']
+        for quant in sorted(SALMON.glob(f"*-{ld.aggregation.baseline}/quant.sf"))
+    ]
+    assert quants, f"No {ld.aggregation.baseline} salmon quantifications found"
+    tpms = pd.concat(quants, axis=1).mean(axis=1).to_dict()
 
-responses = responses.groupby('ID').max()
+# Promoter x transcript group incidence: one edge per (promoter, transcript), repeated edges are summed
+rows, groups, weights = [], [], []
+for row, alltids in enumerate(annotation['Transcript ID']):
+    for tid in alltids:
+        if tid in TX2GROUP:
+            rows.append(row)
+            groups.append(TX2GROUP[tid])
+            weights.append(tpms.get(tid, 0.0))
+incidence = Incidence.build(np.array(rows, dtype=np.int64), groups, len(annotation), np.array(weights))
+
+responses = pd.DataFrame(
+    incidence.reduce(matrix.scores(), ld.aggregation.reducer), index=pd.Index(incidence.groups, name='ID'),
+    columns=list(clusters)
+)
 assert responses.index.is_unique, "There are duplicate groups in the responses!"
 responses = responses.rename(columns={
     'cluster_023': 'IRF6-like',
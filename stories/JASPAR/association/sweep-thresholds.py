@@ -0,0 +1,38 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import ld
+from stories import DE
+from utils import ranksum
+
+summary = pd.read_pickle(ld.TXGROUP_SUMMARY)
+motifs = summary.filter(like='cluster').columns
+lower, upper = ld.thresholds.sweep
+
+results = []
+for ifn in DE.IFNS:
+    for control in ['mock']:
+        if ifn == control:
+            continue
+        mask = (summary[(ifn, 'TPM')] >= ld.thresholds.min_tpm) | (summary[(control, 'TPM')] >= ld.thresholds.min_tpm)
+        print(f"Sweeping thresholds for {ifn}-vs-{control} with {mask.sum()} ({mask.mean():.1%}) targets")
+
+        lfc = summary[(ifn, control, 'log2FoldChange')][mask].to_numpy()
+        tests = ranksum.sweep(lfc, summary[motifs][mask].to_numpy(), lower, upper)
+
+        # (lower x upper x motifs) arrays -> long table, one row per threshold pair and motif
+        grid = np.meshgrid(np.arange(len(lower)), np.arange(len(upper)), np.arange(len(motifs)), indexing='ij')
+        i, j, k = (x.ravel() for x in grid)
+        results.append(pd.DataFrame({
+            'lower': tests.lower[i], 'upper': tests.upper[j], 'motif': [motifs[x][1] for x in k],
+            'target': ifn, 'control': control, 'p-value': tests.pvalue.ravel(),
+            'Mean Δ(log2 fold change)': tests.mean_delta.ravel(),
+            'With motif': tests.n1.ravel(), 'Without motif': tests.n2.ravel(),
+        }))
+
+# Threshold x motif x IFN cube in the long format, grid points without a valid test are NaN
+df = pd.concat(results, ignore_index=True)
+ld.THRESHOLD_SWEEP.parent.mkdir(parents=True, exist_ok=True)
+df.to_pickle(ld.THRESHOLD_SWEEP, protocol=pickle.HIGHEST_PROTOCOL)
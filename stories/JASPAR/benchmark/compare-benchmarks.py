@@ -0,0 +1,29 @@
+import json
+
+import pandas as pd
+
+import ld
+
+# Throughput of every saved run relative to the oldest one
+reports = []
+for path in ld.benchmark.saveto.glob("*.json"):
+    with open(path) as stream:
+        reports.append(json.load(stream))
+reports = sorted(reports, key=lambda report: report["timestamp"])
+
+runs = [f"{report['commit'][:12]}{'-dirty' if report['dirty'] else ''}" for report in reports]
+results = pd.concat([
+    pd.DataFrame(report["results"]).assign(run=run) for report, run in zip(reports, runs)
+], ignore_index=True)
+
+throughput = results.pivot_table(
+    index=["kernel", "axis", "batchsize", "length", "nmotifs"], columns="run", values="throughput"
+)[runs]
+relative = throughput.div(throughput[runs[0]], axis=0)
+
+overhead = pd.DataFrame({run: report["overhead"] for report, run in zip(reports, runs)})[runs]
+
+with pd.option_context("display.max_rows", None, "display.width", 200, "display.float_format", "{:.3g}".format):
+    print("Throughput, bp*motifs/s:", throughput, sep="\n", end="\n\n")
+    print(f"Throughput relative to {runs[0]}:", relative, sep="\n", end="\n\n")
+    print("Per-call overhead, s:", overhead, sep="\n")
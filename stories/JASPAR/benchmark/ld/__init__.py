@@ -0,0 +1,22 @@
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+RESULTS = ROOT / "results"
+
+
+class benchmark:
+    # One JSON file per commit, named after the commit hash
+    saveto = RESULTS
+    seed = 42
+
+    # Each axis is swept with the other two fixed at their default values
+    defaults = {"batchsize": 64, "length": 500, "nmotifs": 128}
+    sweeps = {
+        "batchsize": (1, 8, 64, 256),
+        "length": (100, 500, 2_000, 10_000),
+        "nmotifs": (1, 16, 128, 879),
+    }
+
+    # Each point is repeated at least `repeats` times and for at least `mintime` seconds, the median time is reported
+    repeats = 3
+    mintime = 0.5
@@ -0,0 +1,107 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+import numpy as np
+
+import ld
+from stories.JASPAR import scoring
+from utils import motifs
+
+
+def reference(pwms: motifs.ZeroOrderMotifsCollection) -> Callable[[list[str]], object]:
+    complement = str.maketrans("ACGT", "TGCA")
+    return lambda sequences: [motifs.score(seq, seq.translate(complement)[::-1], pwms) for seq in sequences]
+
+
+def compiled(database: motifs.CompiledMotifs, backend: str) -> Callable[[list[str]], object]:
+    return lambda sequences: motifs.batch(sequences, database, backend=backend)
+
+
+def timeit(function: Callable[[list[str]], object], sequences: list[str]) -> float:
+    function(sequences)  # Warm-up
+
+    times = []
+    while len(times) < ld.benchmark.repeats or sum(times) < ld.benchmark.mintime:
+        start = time.perf_counter()
+        function(sequences)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def peakmemory(function: Callable[[list[str]], object], sequences: list[str]) -> int:
+    # NumPy reports its allocations to tracemalloc, so this covers all intermediate arrays
+    tracemalloc.start()
+    try:
+        function(sequences)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def commit() -> tuple[str, bool]:
+    try:
+        head = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"], text=True, stderr=subprocess.DEVNULL
+        ))
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", True
+    return head, dirty
+
+
+# Synthetic uniform sequences and the first N motifs of the shipped JASPAR collection
+rng = np.random.default_rng(ld.benchmark.seed)
+maxbatch, maxlength = max(ld.benchmark.sweeps["batchsize"]), max(ld.benchmark.sweeps["length"])
+genome = ["".join(rng.choice(list("ACGT"), size=maxlength)) for _ in range(maxbatch)]
+
+database = motifs.database.jaspar(scoring.ld.jaspar.nonredundant, cache=scoring.ld.jaspar.compiled)
+parsed = motifs.parse.jaspar(scoring.ld.jaspar.nonredundant)
+pwms = [motif.to_pwm_hocomoco() for motif in parsed.motifs]
+
+kernels = {
+    "score": lambda n: reference(motifs.ZeroOrderMotifsCollection(parsed.alphabet, motifs=tuple(pwms[:n]))),
+    **{
+        f"batch/{backend}": lambda n, backend=backend: compiled(database.select(database.ids[:n]), backend)
+        for backend in motifs.backends.BACKENDS
+    }
+}
+
+# Per-call overhead: a single short sequence scored with a single motif
+overhead = {}
+for name, kernel in kernels.items():
+    overhead[name] = timeit(kernel(1), [genome[0][:50]])
+    print(f"{name}: {overhead[name] * 1e6:.1f} us per call")
+
+results = []
+for axis, values in ld.benchmark.sweeps.items():
+    for value in values:
+        point = ld.benchmark.defaults | {axis: value}
+        sequences = [seq[:point["length"]] for seq in genome[:point["batchsize"]]]
+        for name, kernel in kernels.items():
+            function = kernel(point["nmotifs"])
+            seconds = timeit(function, sequences)
+            throughput = point["batchsize"] * point["length"] * point["nmotifs"] / seconds
+            results.append({
+                "kernel": name, "axis": axis, **point, "seconds": seconds,
+                "throughput": throughput, "peak-memory": peakmemory(function, sequences)
+            })
+            print(f"{name} {point}: {throughput:.3g} bp*motifs/s")
+
+head, dirty = commit()
+report = {
+    "commit": head, "dirty": dirty, "timestamp": datetime.now(timezone.utc).isoformat(),
+    "host": platform.node(), "python": platform.python_version(), "numpy": np.__version__,
+    "config": {"seed": ld.benchmark.seed, "defaults": ld.benchmark.defaults, "sweeps": ld.benchmark.sweeps},
+    "overhead": overhead, "results": results
+}
+
+ld.benchmark.saveto.mkdir(parents=True, exist_ok=True)
+saveto = ld.benchmark.saveto / f"{head[:12]}{'-dirty' if dirty else ''}.json"
+with open(saveto, "w") as stream:
+    json.dump(report, stream, indent=2)
+print(f"Saved results to {saveto}")
@@ -1,11 +1,15 @@
 import pandas as pd
 
+from utils.motifs.matrix import ScoreMatrix
 from . import ld
 
 
-def motifs() -> pd.DataFrame:
-    return pd.read_pickle(ld.response.per_motif)
+def motifs() -> tuple[pd.DataFrame, ScoreMatrix]:
+    # Annotation of promoters and the on-disk z-scored (promoters x motifs) matrix with the same rows. The matrix is
+    # memory-mapped, read it in chunks of rows to bound the memory usage.
+    return pd.read_pickle(ld.response.annotation), ScoreMatrix(ld.response.per_motif)
 
 
-def clusters() -> pd.DataFrame:
-    return pd.read_pickle(ld.response.per_cluster)
+def clusters() -> tuple[pd.DataFrame, ScoreMatrix]:
+    # Same as `motifs` for re-standardized (promoters x clusters) responses
+    return pd.read_pickle(ld.response.annotation), ScoreMatrix(ld.response.per_cluster)
@@ -1,11 +1,14 @@
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
 
 import ld
 import utils
 from assemblies import GRCh38
 from stories import cCRE
+from utils import motifs
 
 GENCODE = GRCh38.gencode.load()
 
@@ -29,8 +32,8 @@ for tid, imputed, seqid, start, end in overlaps.itertuples(index=False, name=Non
     assert roi2imputed[seqid, start, end] == imputed, (seqid, start, end, imputed)
 roi2transcripts = {k: sorted(v) for k, v in roi2transcripts.items()}
 
-# Load pre-calculated scores for all promoters and match them with Transcript IDs / Imputed status
-responses = pd.read_pickle(ld.response.scores)
+# Load coordinates of pre-calculated scores and match them with Transcript IDs / Imputed status
+responses = pd.read_pickle(ld.response.regions)
 responses['Transcript ID'] = [
     roi2transcripts[k] for k in zip(responses['seqid'], responses['roi-norm-start'], responses['roi-norm-end'])
 ]
@@ -48,38 +51,59 @@ responses['is-reference'] = (
         (~responses['imputed']) &
         responses['Transcript ID'].apply(lambda x: any(tid in references for tid in x))
 )
+isreference = responses['is-reference'].to_numpy()
 
-# Z-score the response scores for each promoter using reference promoters
-motifs = [col for col in responses.columns if isinstance(col, tuple) and len(col) == 2]
-references = responses.loc[responses['is-reference'], motifs]
-mean, std = references.mean(), references.std()
+# Z-score the response scores for each promoter using reference promoters. Scores are streamed from disk in chunks of
+# rows: the first pass collects reference statistics, the second one writes z-scores.
+matrix = motifs.matrix.ScoreMatrix(ld.response.scores)
+ids, targets = matrix.motifs()
+chunks = matrix.chunks(ld.response.rows)
+scores = matrix.scores()
 
-for col in motifs:
-    responses[col] = (responses[col] - mean[col]) / std[col]
+moments = motifs.matrix.Moments.empty(len(ids))
+for rows in chunks:
+    moments = moments.update(scores[rows][isreference[rows]])
+mean, std = moments.mean, moments.std()
 
-# Clean up the DataFrame
-responses = responses[['Transcript ID', 'seqid', 'roi-norm-start', 'roi-norm-end', 'is-reference', *motifs]].copy()
-responses.to_pickle(ld.response.per_motif, protocol=-1)
+zscores = motifs.matrix.ScoreMatrix.create(ld.response.per_motif, len(responses), ids, targets).scores(mode="r+")
+for rows in chunks:
+    zscores[rows] = (scores[rows] - mean) / std
+zscores.flush()
+
+# Clean up the annotation of rows
+responses = responses[['Transcript ID', 'seqid', 'roi-norm-start', 'roi-norm-end', 'is-reference']].copy()
+responses.to_pickle(ld.response.annotation, protocol=-1)
 
 # Aggregate to the level of clusters and re-standardize
 jaspar = pd.read_pickle(ld.jaspar.parsed_clusters)
 
-# Drop TF names
-renaming = {x: x[0] for x in motifs}
-assert len(set(renaming.values())) == len(renaming)
-responses = responses.rename(columns=renaming)
+columns = {ind: i for i, ind in enumerate(ids)}
+assert len(columns) == len(ids)
 
-for cluster, ids in jaspar[['cluster', 'id']].itertuples(index=False, name=None):
+for cluster, cluster_ids in jaspar[['cluster', 'id']].itertuples(index=False, name=None):
     # Check that all motifs in the cluster are present in the responses
-    assert all(id in responses.columns for id in ids), \
-        f"Cluster {cluster} has missing motifs: {set(ids) - set(responses.columns)}"
-
-    responses[cluster] = responses[list(ids)].sum(axis=1)
-
-    # Re-standardize the cluster scores using the mean and std of the reference promoters
-    references = responses.loc[responses['is-reference'], cluster]
-    mean, std = references.mean(), references.std()
+    assert all(ind in columns for ind in cluster_ids), \
+        f"Cluster {cluster} has missing motifs: {set(cluster_ids) - columns.keys()}"
+
+# Sparse (motifs x clusters) membership matrix, cluster scores are sums of member z-scores
+motif2cluster = [(columns[ind], cluster) for cluster, cluster_ids in enumerate(jaspar['id']) for ind in cluster_ids]
+membership = sparse.csr_array(
+    (np.ones(len(motif2cluster), dtype=np.float32), tuple(np.array(motif2cluster, dtype=np.int64).T)),
+    shape=(len(ids), len(jaspar))
+)
 
-    responses[cluster] = (responses[cluster] - mean) / std
-responses = responses.drop(columns=list(renaming.values()))
-responses.to_pickle(ld.response.per_cluster, protocol=-1)
+# Cluster scores are streamed in two passes over the rows: the first one writes sums of member z-scores and collects
+# reference statistics, the second one re-standardizes them in place using the reference promoters
+clusters = motifs.matrix.ScoreMatrix.create(
+    ld.response.per_cluster, len(responses), tuple(jaspar['cluster']), tuple(jaspar['name'])
+).scores(mode="r+")
+moments = motifs.matrix.Moments.empty(len(jaspar))
+for rows in chunks:
+    sums = zscores[rows] @ membership
+    clusters[rows] = sums
+    moments = moments.update(sums[isreference[rows]])
+
+mean, std = moments.mean, moments.std()
+for rows in chunks:
+    clusters[rows] = (clusters[rows] - mean) / std
+clusters.flush()
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+import ld
+from utils import motifs
+
+# Motif similarity is defined on PFMs, not on PWMs
+database = motifs.parse.jaspar(ld.jaspar.nonredundant).compile()
+
+print(f"Calculating all-vs-all similarity for {len(database)} motifs...")
+similarity = motifs.similarity.similarity(database)
+similarity.save(ld.jaspar.similarity)
+
+# Clusters are named after the shipped cluster with (mostly) the same motifs: mutual best matches by the Jaccard index
+# of members, at least a half. Curated names of shipped clusters (ISRE-like, GAS-like, etc.) then keep pointing at the
+# same motifs, other clusters are numbered after the last shipped one.
+labels = similarity.clusters(ld.jaspar.threshold)
+members = [np.flatnonzero(labels == label) for label in range(labels.max(initial=-1) + 1)]
+shipped = pd.read_csv(ld.jaspar.clusters, sep="\t")
+shipped_ids = [{x.split('_')[3] for x in ids.split(',')} for ids in shipped['id']]
+
+ids = [{database.ids[i] for i in indices} for indices in members]
+jaccard = np.array([[len(new & old) / len(new | old) for old in shipped_ids] for new in ids])
+best = jaccard.argmax(axis=1)
+matched = (jaccard.argmax(axis=0)[best] == np.arange(len(members))) & (jaccard[np.arange(len(members)), best] >= 0.5)
+
+last = int(shipped['cluster'].str.removeprefix('cluster_').astype(int).max())
+names = shipped['cluster'].to_numpy()[best].astype(object)
+names[~matched] = [f"cluster_{last + i + 1:03d}" for i in range(np.count_nonzero(~matched))]
+print(f"{matched.sum()} of {len(members)} clusters match a shipped cluster")
+
+# Save clusters in the same format as the shipped clusters.tab
+records = []
+for label in np.argsort(names, kind='stable'):
+    records.append({
+        "cluster": names[label],
+        "id": ",".join(f"JASPAR_vertebrates_CORE_{database.ids[i]}_n{i + 1}" for i in members[label]),
+        "name": ",".join(database.targets[i] for i in members[label]),
+    })
+clusters = pd.DataFrame(records)
+print(f"Found {len(clusters)} clusters")
+
+ld.jaspar.reclustered.parent.mkdir(parents=True, exist_ok=True)
+clusters.to_csv(ld.jaspar.reclustered, sep="\t", index=False)
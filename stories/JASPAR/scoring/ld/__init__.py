@@ -8,12 +8,35 @@ RESOURCES = ROOT / "resources"
 class jaspar:
     nonredundant = RESOURCES / "JASPAR2024_CORE_vertebrates_non-redundant_pfms_jaspar.txt"
     redundant = RESOURCES / "JASPAR2024_CORE_vertebrates_redundant_pfms_jaspar.txt"
+    compiled = RESULTS / "compiled"
 
+    # Shipped clustering of the non-redundant collection. `reclustered` is produced by cluster-jaspar.py for the same
+    # collection, its clusters are named after matching shipped clusters where they exist.
     clusters = RESOURCES / "clusters.tab"
+    similarity = RESULTS / "similarity.npz"
+    reclustered = RESULTS / "clusters.tab"
+    # Ncor cutoff for average linkage clustering, it gives the closest match to the shipped clusters
+    threshold = 0.45
     parsed_clusters = RESULTS / "parsed-clusters.pkl"
 
 
 class response:
-    scores = RESULTS / "scores.pkl"
-    per_motif = RESULTS / "motif-responses.pkl"
-    per_cluster = RESULTS / "cluster-responses.pkl"
+    # Number of promoters scored by a single worker task
+    chunksize = 1024
+    # Merge overlapping promoters and scan each merged span once instead of every promoter on its own. It only pays
+    # off for densely overlapping promoters: at ~1.8x overlap it is slightly slower than scanning promoters one by one.
+    merge = False
+    # Number of rows of on-disk score matrices processed at once, bounds the memory usage
+    rows = 65_536
+
+    # Raw scores (promoters x motifs) as an on-disk matrix and promoter coordinates for its rows
+    scores = RESULTS / "scores"
+    regions = RESULTS / "regions.pkl"
+    shards = RESULTS / "scores-shards"
+    # Scores of (sequence, motif) pairs kept between runs
+    cache = RESULTS / "score-cache"
+
+    # Z-scored motif and cluster responses as on-disk matrices and the annotation of their rows
+    per_motif = RESULTS / "motif-responses"
+    annotation = RESULTS / "motif-responses.pkl"
+    per_cluster = RESULTS / "cluster-responses"
@@ -17,13 +17,13 @@ for ids in jaspar['id']:
     allids |= unique
 jaspar['id'] = parsed_ids
 
-jaspar['cluster'] = jaspar['cluster'].apply(lambda x: {
-    'cluster_127': 'CTCF [1]',
-    'cluster_128': 'CTCF [2]',
-}.get(x, x))
 jaspar['cluster'] = jaspar['cluster'].where(
     ~((jaspar['id'].apply(len) == 1) & (jaspar['cluster'].str.startswith('cluster_'))), jaspar['name']
 )
+
+# Singletons of the same TF (e.g. CTCF) are numbered in the order of appearance: CTCF [1], CTCF [2], ...
+duplicated = jaspar['cluster'].duplicated(keep=False)
+jaspar.loc[duplicated, 'cluster'] += jaspar[duplicated].groupby('cluster').cumcount().add(1).map(' [{}]'.format)
 assert jaspar['cluster'].nunique() == len(jaspar)
 
 ld.jaspar.parsed_clusters.parent.mkdir(parents=True, exist_ok=True)
@@ -1,47 +1,103 @@
+import hashlib
+
+import numpy as np
 import pandas as pd
-from biobit import io
 from joblib import Parallel, delayed
 
 import ld
-from assemblies import GRCh38
 from stories import cCRE
-from utils import motifs, fasta
-
+from utils import motifs, parallel, Shards
 
-def screen(seqid: str, start: int, end: int, allmotifs: motifs.ZeroOrderMotifsCollection):
-    reader = io.fasta.IndexedReader(GRCh38.fasta)
-    forward = fasta.fetch(reader, seqid, (start, end), strand='+')
-    revcomp = fasta.fetch(reader, seqid, (start, end), strand='-')
 
-    # Calculate motif response score for each promoter as a maximum of its forward and reverse complement scores
-    scores = motifs.score(forward.upper(), revcomp.upper(), allmotifs)
+def screen(regions: pd.DataFrame, allmotifs: motifs.CompiledMotifs) -> np.ndarray:
+    # Motif response score for each promoter is a maximum over all windows on both strands. Workers use the fixed
+    # gemm backend: scores don't depend on the machine and workers never autotune concurrently.
+    if ld.response.merge:
+        return motifs.windows.batch(
+            regions['seqid'].tolist(), regions['roi-norm-start'].to_numpy(), regions['roi-norm-end'].to_numpy(),
+            regions['sequence'].tolist(), allmotifs, backend="gemm"
+        )
+    return motifs.batch(regions['sequence'].tolist(), allmotifs, backend="gemm")
 
-    record = {"seqid": seqid, "roi-norm-start": start, "roi-norm-end": end}
-    for motif, score in zip(allmotifs.motifs, scores):
-        record[motif.ind, motif.target] = score
-    return record
 
+def chunking(subset: pd.DataFrame) -> np.ndarray:
+    # Contiguous chunks of promoters are scored by workers. Chunks never split a group of overlapping promoters, so
+    # that each group can be scanned once in the merge mode. Each chunk starts at the first group that begins at or
+    # after a multiple of the chunk size (if there is one).
+    spanids, *_ = motifs.windows.merge(subset['seqid'], subset['roi-norm-start'], subset['roi-norm-end'])
+    first = np.flatnonzero(np.diff(spanids, prepend=-1))
+    targets = np.searchsorted(first, np.arange(0, len(subset), ld.response.chunksize))
+    bounds = np.append(np.unique(first[targets[targets < len(first)]]), len(subset))
+    assert (len(subset) == 0 or bounds[0] == 0) and np.all(np.diff(bounds) > 0), "Chunks must cover all promoters"
+    assert np.isin(bounds[:-1], first).all(), "Chunks must not split groups of overlapping promoters"
+    return bounds
 
-# Load all motifs and calculate PWMs
-with open(ld.jaspar.nonredundant) as f:
-    jaspar = motifs.parse.jaspar(f)
 
-pwms = tuple(pfm.to_pwm_hocomoco() for pfm in jaspar.motifs)
-database = motifs.ZeroOrderMotifsCollection("ACGT", motifs=pwms)
+# Load all motifs as compiled PWMs (cached between runs)
+database = motifs.database.jaspar(ld.jaspar.nonredundant, cache=ld.jaspar.compiled)
 
-# Load promoter sequences
+# Load promoter sequences derived by the cCRE story
 sequences = cCRE.sequences()
 sequences = sequences[sequences['roi-type'] == 'PLS']
-regions = sequences[['seqid', 'roi-norm-start', 'roi-norm-end']].drop_duplicates()
-
-# Calculate per-motif scores for each promoter
-print(f"Calculating per-motif scores for {len(regions)} promoters...")
-records = Parallel(n_jobs=-1, verbose=100, pre_dispatch='all', batch_size=1024)(
-    delayed(screen)(seqid, start, end, database)
-    for seqid, start, end in regions.itertuples(index=False, name=None)
-)
-df = pd.DataFrame(records)
-
-# Save the results
-ld.response.scores.parent.mkdir(parents=True, exist_ok=True)
-df.to_pickle(ld.response.scores, protocol=-1)
+regions = sequences[['seqid', 'roi-norm-start', 'roi-norm-end', 'sequence']].drop_duplicates(
+    ['seqid', 'roi-norm-start', 'roi-norm-end']
+).sort_values(['seqid', 'roi-norm-start', 'roi-norm-end'], ignore_index=True)
+
+# Identical sequences under different coordinates (segmental duplications, alt contigs, etc.) are scored once
+codes, _ = pd.factorize(regions['sequence'])
+unique = regions[~regions['sequence'].duplicated()].reset_index(drop=True)
+print(f"{len(regions)} promoters have {len(unique)} unique sequences "
+      f"(deduplication ratio: {len(regions) / max(len(unique), 1):.3f})")
+
+# Scores are cached per (sequence, motif) pair: adding motifs or promoters only scores the missing pairs. Cached
+# scores are assembled on disk, factorization codes follow the order of first occurrence, i.e. of unique sequences.
+cache = motifs.cache.ScoreCache(ld.response.cache)
+ld.response.shards.mkdir(parents=True, exist_ok=True)
+keys, mdigests = motifs.cache.digests(unique['sequence'].tolist()), database.digests()
+merged, groups = cache.lookup(keys, mdigests, chunksize=ld.response.rows, out=np.lib.format.open_memmap(
+    ld.response.shards / "merged.npy", mode="w+", dtype=np.float32, shape=(len(unique), len(database))
+))
+print(f"{sum(len(rows) * len(indices) for rows, indices in groups)} of {len(unique) * len(database)} "
+      f"(promoter, motif) pairs are not cached, scoring them in {len(groups)} groups")
+
+# Threads on a free-threaded interpreter share the database and sequences, processes are used otherwise
+print(f"Running with the {parallel.backend()} backend")
+for rows, indices in groups:
+    subset = unique.iloc[rows]
+    selected = database.select([database.ids[i] for i in indices])
+    bounds = chunking(subset)
+    chunks = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+    print(f"Calculating scores of {len(selected)} motifs for {len(subset)} promoters in {len(chunks)} chunks...")
+
+    # Finished chunks are saved as shards, interrupted runs with the same inputs skip them
+    key = hashlib.sha256("".join(selected.digests()).encode())
+    key.update(keys[rows].tobytes())
+    key.update(bounds.astype(np.int64).tobytes())
+    shards = Shards(ld.response.shards / "pending", key.hexdigest())
+
+    completed = shards.resume()
+    pending = [chunk for chunk in chunks if chunk not in completed]
+    print(f"{len(chunks) - len(pending)} chunks are already completed")
+
+    with parallel.limits():
+        blocks = Parallel(n_jobs=-1, backend=parallel.backend(), verbose=10, return_as="generator")(
+            delayed(screen)(subset.iloc[start:end], selected) for start, end in pending
+        )
+        for block, (start, end) in zip(blocks, pending):
+            shards.store(start, end, block)
+
+    # Shards are moved to the cache and the merged matrix one at a time
+    for start, end in chunks:
+        block = shards.load(start, end)
+        merged[np.ix_(rows[start:end], indices)] = block
+        cache.store(keys[rows[start:end]], [mdigests[i] for i in indices], block)
+    shards.clear()
+
+matrix = motifs.matrix.ScoreMatrix.create(ld.response.scores, len(regions), database.ids, database.targets)
+scores = matrix.scores(mode="r+")
+for rows in matrix.chunks(ld.response.rows):
+    scores[rows] = merged[codes[rows]]
+scores.flush()
+
+# Save the results: promoter coordinates in the same order as rows of the score matrix
+regions[['seqid', 'roi-norm-start', 'roi-norm-end']].to_pickle(ld.response.regions, protocol=-1)
@@ -0,0 +1,21 @@
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+RESULTS = ROOT / "results"
+
+
+class tracks:
+    saveto = RESULTS / "bigwig"
+
+    # Chromosomes are scanned in chunks of this size, each chunk is extended by the motif width - 1
+    chunksize = 100_000
+
+    # JASPAR clusters exported as tracks (maximum over all member motifs) and their track names
+    clusters = {
+        'cluster_041': 'ISRE-like',
+        'cluster_025': 'GAS-like',
+        'cluster_023': 'IRF6-like',
+        'cluster_050': 'ZNF135-ZNF460',
+    }
+    # Individual JASPAR motifs exported as tracks
+    motifs: tuple[str, ...] = ()
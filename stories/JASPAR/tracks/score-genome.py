@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pyBigWig
+from biobit import io
+from joblib import Parallel, delayed
+
+import ld
+from assemblies import GRCh38
+from stories.JASPAR import scoring
+from utils import motifs, fasta
+
+
+def job(
+        seqid: str, start: int, end: int, size: int, database: motifs.CompiledMotifs, tracks: dict[str, list[int]]
+) -> dict[str, np.ndarray]:
+    # Extend the chunk to complete all windows starting inside it
+    reader = io.fasta.IndexedReader(GRCh38.fasta)
+    sequence = fasta.fetch(reader, seqid, (start, min(end + database.width - 1, size)))
+
+    profile = motifs.profile(sequence, database)[:end - start]
+    return {name: profile[:, indices].max(axis=1) for name, indices in tracks.items()}
+
+
+# Load all motifs and select the ones required for tracks
+database = motifs.database.jaspar(scoring.ld.jaspar.nonredundant, cache=scoring.ld.jaspar.compiled)
+clusters = pd.read_pickle(scoring.ld.jaspar.parsed_clusters).set_index('cluster')['id']
+
+members = {ld.tracks.clusters[cluster]: sorted(clusters[cluster]) for cluster in ld.tracks.clusters}
+members |= {motif: [motif] for motif in ld.tracks.motifs}
+
+selected = sorted({ind for ids in members.values() for ind in ids})
+database = database.select(selected)
+tracks = {name: [selected.index(ind) for ind in ids] for name, ids in members.items()}
+
+# Split all chromosomes into chunks
+sizes = GRCh38.seqid.sizes()
+chunks = [
+    (seqid, start, min(start + ld.tracks.chunksize, size), size)
+    for seqid, size in sizes.items() for start in range(0, size, ld.tracks.chunksize)
+]
+print(f"Scoring {len(chunks)} chunks of {ld.tracks.chunksize:,} bp for {len(tracks)} tracks...")
+
+# Open all bigWig files. Entries must be added in the header order, i.e. chunks are consumed in order.
+ld.tracks.saveto.mkdir(parents=True, exist_ok=True)
+writers = {}
+for name in tracks:
+    writers[name] = pyBigWig.open((ld.tracks.saveto / f"{name}.bw").as_posix(), "w")
+    writers[name].addHeader(list(sizes.items()))
+
+# Results are streamed in order while at most a few chunks per core are in flight
+results = Parallel(n_jobs=-1, verbose=10, return_as="generator")(
+    delayed(job)(seqid, start, end, size, database, tracks) for seqid, start, end, size in chunks
+)
+for (seqid, start, _, _), profiles in zip(chunks, results):
+    for name, values in profiles.items():
+        # Windows that don't fit into the chromosome end are -inf and are not reported
+        values = values[np.isfinite(values)].astype(np.float64)
+        if len(values) > 0:
+            writers[name].addEntries(seqid, start, values=values, span=1, step=1)
+
+for writer in writers.values():
+    writer.close()
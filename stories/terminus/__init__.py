@@ -1 +1 @@
-from .ld import TX2GROUP, GROUP2GENE, TPMS, READS, GROUPS
+from .ld import SALMON, TX2GROUP, GROUP2GENE, TPMS, READS, GROUPS
@@ -1,2 +1,4 @@
-from . import rnas, bed, fasta, motifs
-from .pkl import PklData
+from . import rnas, bed, fasta, motifs, parallel, ranksum, regression
+from .incidence import Incidence
+from .pkl import PklData, atomic_write
+from .shards import Shards
@@ -0,0 +1,123 @@
+from collections.abc import Hashable, Sequence
+from dataclasses import dataclass
+from typing import Literal, Self
+
+import numpy as np
+import numpy.typing as npt
+from scipy import sparse
+
+Reducer = Literal["max", "mean", "weighted"]
+
+
+@dataclass(frozen=True)
+class Incidence:
+    """
+    Sparse (groups x rows) incidence matrix used to aggregate row-level values (e.g. promoter responses) into groups
+    (e.g. transcript groups). A row may belong to any number of groups. Each edge carries a non-negative weight that
+    is only used by the weighted mean. Groups are sorted and always have at least one row.
+
+    Membership is kept as a structural matrix with unit entries, separately from the edge weights, so that zero weights
+    never affect which rows belong to a group.
+    """
+    groups: tuple[Hashable, ...]
+    membership: sparse.csr_array
+    weights: sparse.csr_array
+
+    @property
+    def nrows(self) -> int:
+        return self.membership.shape[1]
+
+    @classmethod
+    def build(
+            cls, rows: npt.NDArray[np.int64], groups: Sequence[Hashable], nrows: int,
+            weights: npt.NDArray[np.floating] | None = None
+    ) -> Self:
+        # Edges are (row, group, weight) triplets. Repeated edges are merged and their weights are summed.
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) != len(groups) or (weights is not None and len(weights) != len(rows)):
+            raise ValueError("Rows, groups and weights must describe the same number of edges")
+        if len(rows) > 0 and (rows.min() < 0 or rows.max() >= nrows):
+            raise ValueError(f"Row indices must be within [0, {nrows})")
+        if weights is None:
+            weights = np.zeros(len(rows), dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if np.any(weights < 0) or not np.all(np.isfinite(weights)):
+            raise ValueError("Edge weights must be finite and non-negative")
+
+        codes, labels = _factorize(groups)
+        shape = (len(labels), nrows)
+        membership = sparse.coo_array((np.ones(len(rows)), (codes, rows)), shape=shape).tocsr()
+        membership.sum_duplicates()
+        membership.data[:] = 1
+        weights = sparse.coo_array((weights, (codes, rows)), shape=shape).tocsr()
+        weights.sum_duplicates()
+        return cls(tuple(labels), membership, weights)
+
+    @property
+    def counts(self) -> npt.NDArray[np.int64]:
+        return np.diff(self.membership.indptr)
+
+    def _validate(self, values: npt.NDArray[np.floating]):
+        if values.ndim != 2 or values.shape[0] != self.nrows:
+            raise ValueError(f"Expected a ({self.nrows} x columns) matrix, got: {values.shape}")
+
+    def max(self, values: npt.NDArray[np.floating], chunksize: int = 65_536) -> npt.NDArray[np.floating]:
+        # Edges are gathered in blocks of whole groups, so that at most ~chunksize rows are copied at once
+        self._validate(values)
+        indptr, indices = self.membership.indptr, self.membership.indices
+        result = np.empty((len(self.groups), values.shape[1]), dtype=values.dtype)
+
+        start = 0
+        while start < len(self.groups):
+            end = max(int(np.searchsorted(indptr, indptr[start] + chunksize, side='right')) - 1, start + 1)
+            end = min(end, len(self.groups))
+            block = values[indices[indptr[start]:indptr[end]]]
+            result[start:end] = np.maximum.reduceat(block, indptr[start:end] - indptr[start], axis=0)
+            start = end
+        return result
+
+    def mean(self, values: npt.NDArray[np.floating], chunksize: int = 65_536) -> npt.NDArray[np.floating]:
+        self._validate(values)
+        sums = _product(self.membership, values, chunksize)
+        return (sums / self.counts[:, None]).astype(values.dtype)
+
+    def weighted(self, values: npt.NDArray[np.floating], chunksize: int = 65_536) -> npt.NDArray[np.floating]:
+        # Weighted mean with edge weights. Groups with zero total weight fall back to the unweighted mean.
+        self._validate(values)
+        totals = self.weights.sum(axis=1)
+        sums = _product(self.weights, values, chunksize)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = sums / totals[:, None]
+
+        empty = totals == 0
+        if empty.any():
+            result[empty] = (_product(self.membership, values, chunksize) / self.counts[:, None])[empty]
+        return result.astype(values.dtype)
+
+    def reduce(self, values: npt.NDArray[np.floating], reducer: Reducer) -> npt.NDArray[np.floating]:
+        match reducer:
+            case "max":
+                return self.max(values)
+            case "mean":
+                return self.mean(values)
+            case "weighted":
+                return self.weighted(values)
+            case _:
+                raise ValueError(f"Unknown reducer: {reducer}")
+
+
+def _factorize(labels: Sequence[Hashable]) -> tuple[npt.NDArray[np.int64], list[Hashable]]:
+    # Sorted unique labels and the code of each input label
+    unique = sorted(set(labels))
+    mapping = {label: code for code, label in enumerate(unique)}
+    return np.fromiter((mapping[label] for label in labels), dtype=np.int64, count=len(labels)), unique
+
+
+def _product(matrix: sparse.csr_array, values: npt.NDArray[np.floating], chunksize: int) -> npt.NDArray[np.float64]:
+    # Sparse (groups x rows) @ dense (rows x columns) product in float64, reading chunksize rows of values at a time
+    columns = matrix.tocsc()
+    result = np.zeros((matrix.shape[0], values.shape[1]), dtype=np.float64)
+    for start in range(0, values.shape[0], chunksize):
+        end = min(start + chunksize, values.shape[0])
+        result += columns[:, start:end] @ np.asarray(values[start:end], dtype=np.float64)
+    return result
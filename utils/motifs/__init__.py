@@ -1,5 +1,9 @@
-from . import parse
-from .motif import ZeroOrderMotif, ZeroOrderMotifsCollection
-from .scoring import score
+from . import parse, database, backends, cache, quantized, pvalues, hits, variants, similarity, windows, matrix
+from .motif import ZeroOrderMotif, ZeroOrderMotifsCollection, CompiledMotifs
+from .scoring import score, batch, scan, profile, Statistics
 
-__all__ = ['score', 'ZeroOrderMotif', 'ZeroOrderMotifsCollection', 'parse']
+__all__ = [
+    'score', 'batch', 'scan', 'profile', 'Statistics', 'ZeroOrderMotif', 'ZeroOrderMotifsCollection', 'CompiledMotifs',
+    'parse', 'database', 'backends', 'cache', 'quantized', 'pvalues', 'hits', 'variants', 'similarity',
+    'windows', 'matrix'
+]
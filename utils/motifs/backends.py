@@ -0,0 +1,119 @@
+import fcntl
+import json
+import os
+import platform
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+from scipy import fft as spfft
+
+from utils.pkl import atomic_write
+
+# Each backend takes a zero-padded (sequences x positions + width - 1 x letters) encoding and a stacked
+# (motifs x letters x width) tensor and returns raw (sequences x positions x motifs) responses of all windows.
+Kernel = Callable[[npt.NDArray[np.float32], npt.NDArray[np.float32]], npt.NDArray[np.float32]]
+
+Backend = Literal["gemm", "direct", "fft"]
+
+
+def gemm(encoded: npt.NDArray[np.float32], matrix: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    # Sliding windows times the stacked PWMs as a single matrix multiplication
+    width = matrix.shape[2]
+    windows = np.lib.stride_tricks.sliding_window_view(encoded, width, axis=1)
+    nseqs, npos = windows.shape[:2]
+    kernel = matrix.transpose(1, 2, 0).reshape(-1, matrix.shape[0])
+    return (windows.reshape(nseqs * npos, -1) @ kernel).reshape(nseqs, npos, -1)
+
+
+def direct(encoded: npt.NDArray[np.float32], matrix: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    # Accumulate responses one PWM column at a time
+    width = matrix.shape[2]
+    npos = encoded.shape[1] - width + 1
+    responses = np.zeros((encoded.shape[0], npos, matrix.shape[0]), dtype=np.float32)
+    for column in range(width):
+        responses += encoded[:, column:column + npos, :] @ matrix[:, :, column].T
+    return responses
+
+
+def fft(encoded: npt.NDArray[np.float32], matrix: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    # Cross-correlation as a convolution with reversed PWMs in the frequency domain. Circular wrap-around only
+    # affects the first width - 1 positions of the full convolution, which are discarded.
+    width = matrix.shape[2]
+    npos = encoded.shape[1] - width + 1
+    size = spfft.next_fast_len(encoded.shape[1], real=True)
+
+    signal = spfft.rfft(encoded, n=size, axis=1).transpose(1, 0, 2)  # (frequencies x sequences x letters)
+    kernels = spfft.rfft(matrix[:, :, ::-1], n=size, axis=2).transpose(2, 1, 0)  # (frequencies x letters x motifs)
+    spectrum = (signal @ kernels).transpose(1, 0, 2)
+    return spfft.irfft(spectrum, n=size, axis=1)[:, width - 1:width - 1 + npos, :].astype(np.float32, copy=False)
+
+
+BACKENDS: dict[Backend, Kernel] = {"gemm": gemm, "direct": direct, "fft": fft}
+
+# Autotuning results are specific to the machine and shared between runs
+CACHE = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "ifn-resource" / \
+        f"motif-backends.{platform.node()}.json"
+_TUNED: dict[str, Backend] | None = None
+_LOCK = threading.Lock()
+
+
+def _bucket(size: int) -> int:
+    return 1 << max(size - 1, 0).bit_length()
+
+
+def shape_class(encoded: npt.NDArray[np.float32], matrix: npt.NDArray[np.float32]) -> str:
+    nseqs, npos, nmotifs = encoded.shape[0], encoded.shape[1] - matrix.shape[2] + 1, matrix.shape[0]
+    return f"{_bucket(nseqs)}x{_bucket(npos)}x{_bucket(nmotifs)}x{matrix.shape[2]}"
+
+
+def _read() -> dict[str, Backend]:
+    return json.loads(CACHE.read_text()) if CACHE.exists() else {}
+
+
+def _tuned() -> dict[str, Backend]:
+    global _TUNED
+    with _LOCK:
+        if _TUNED is None:
+            _TUNED = _read()
+        return _TUNED
+
+
+def _remember(key: str, backend: Backend):
+    global _TUNED
+    CACHE.parent.mkdir(parents=True, exist_ok=True)
+    # Threads are serialized by the lock, processes by the lock file. The cache is re-read under both locks to keep
+    # entries added by other processes.
+    with _LOCK, open(CACHE.with_suffix(".lock"), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        tuned = {**_read(), **(_TUNED or {}), key: backend}
+        content = json.dumps(tuned, indent=2, sort_keys=True).encode()
+        atomic_write(CACHE, lambda stream: stream.write(content))
+        _TUNED = tuned
+
+
+def responses(
+        encoded: npt.NDArray[np.float32], matrix: npt.NDArray[np.float32], backend: Backend | Literal["auto"] = "gemm"
+) -> npt.NDArray[np.float32]:
+    # The "auto" mode is opt-in: the first call for each shape class times all backends and the fastest one is
+    # remembered. Results then depend on the machine, e.g. fft differs from gemm by ~1e-5.
+    if backend != "auto":
+        return BACKENDS[backend](encoded, matrix)
+
+    key = shape_class(encoded, matrix)
+    if (tuned := _tuned().get(key)) is not None:
+        return BACKENDS[tuned](encoded, matrix)
+
+    timings, result = {}, None
+    for name, kernel in BACKENDS.items():
+        start = time.perf_counter()
+        candidate = kernel(encoded, matrix)
+        timings[name] = time.perf_counter() - start
+        if min(timings, key=timings.get) == name:
+            result = candidate
+    _remember(key, min(timings, key=timings.get))
+    return result
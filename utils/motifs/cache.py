@@ -0,0 +1,124 @@
+import hashlib
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+
+from utils.pkl import atomic_write
+
+from .backends import Backend
+from .motif import CompiledMotifs, ZeroOrderMotif, ZeroOrderMotifsCollection
+from .scoring import _compile, batch
+
+# Bump to invalidate all cached scores if the definition of the score or the layout of blocks changes
+_VERSION = "max-both-strands-v2"
+
+
+def digests(sequences: Sequence[str]) -> npt.NDArray[np.bytes_]:
+    return np.array([hashlib.blake2b(seq.encode("ASCII"), digest_size=16).digest() for seq in sequences], dtype="S16")
+
+
+@define(slots=True, frozen=True)
+class ScoreCache:
+    # Persistent `scoring.batch` scores keyed by (sequence hash, motif matrix hash). Scores are saved as row blocks:
+    # sorted sequence keys and motif digests of the block plus a (sequences x motifs) matrix that is memory-mapped on
+    # lookup. Adding motifs or sequences only requires scoring the missing pairs.
+    root: Path
+
+    @property
+    def _blocks(self) -> Path:
+        return self.root / _VERSION
+
+    def _index(self) -> list[tuple[Path, npt.NDArray[np.bytes_], list[str]]]:
+        # The index is written after the scores, i.e. blocks without it are incomplete and ignored
+        blocks = []
+        for path in sorted(self._blocks.glob("*.npz")):
+            with np.load(path, allow_pickle=False) as data:
+                blocks.append((path.with_suffix(".npy"), data['keys'], data['motifs'].tolist()))
+        return blocks
+
+    def store(self, keys: npt.NDArray[np.bytes_], mdigests: Sequence[str], scores: npt.NDArray[np.float32]):
+        # Save (sequences x motifs) scores as a single block
+        order = np.argsort(keys)
+        keys, scores = keys[order], np.asarray(scores, dtype=np.float32)[order]
+        name = hashlib.sha256(keys.tobytes() + "".join(mdigests).encode()).hexdigest()[:32]
+        atomic_write(self._blocks / f"{name}.npy", lambda stream: np.save(stream, scores))
+        atomic_write(self._blocks / f"{name}.npz", lambda stream: np.savez(
+            stream, keys=keys, motifs=np.array(mdigests, dtype=str)
+        ))
+
+    def _fill(
+            self, blocks: list[tuple[Path, npt.NDArray[np.bytes_], list[str]]], keys: npt.NDArray[np.bytes_],
+            mdigests: Sequence[str], results: npt.NDArray[np.float32]
+    ) -> npt.NDArray[np.bool_]:
+        # Copy cached scores of (keys x motifs) into results and return the mask of missing pairs
+        missing = np.ones((len(keys), len(mdigests)), dtype=np.bool_)
+        for path, stored, smotifs in blocks:
+            if len(stored) == 0:
+                continue
+            position = np.minimum(np.searchsorted(stored, keys), len(stored) - 1)
+            found = np.flatnonzero(stored[position] == keys)
+            columns = {digest: ind for ind, digest in enumerate(smotifs)}
+            requested = [ind for ind, digest in enumerate(mdigests) if digest in columns]
+            if len(found) == 0 or not requested:
+                continue
+            scores = np.load(path, mmap_mode="r")[position[found]][:, [columns[mdigests[i]] for i in requested]]
+            results[np.ix_(found, requested)] = scores
+            missing[np.ix_(found, requested)] = False
+        return missing
+
+    def lookup(
+            self, keys: npt.NDArray[np.bytes_], mdigests: Sequence[str], out: npt.NDArray[np.float32] | None = None,
+            chunksize: int = 65_536
+    ) -> tuple[npt.NDArray[np.float32], list[tuple[npt.NDArray[np.int64], list[int]]]]:
+        """
+        Cached (sequences x motifs) scores, optionally into a pre-allocated array (e.g. a memory map), and the missing
+        pairs as (rows, motifs) groups: motifs that miss the same sequences are grouped to score each group with a
+        single call. Sequences are processed in chunks of rows to bound the memory usage.
+        """
+        blocks = self._index()
+        results = np.empty((len(keys), len(mdigests)), dtype=np.float32) if out is None else out
+
+        # Motifs keep the same group label while their missing rows match. Labels are refined chunk by chunk, rows
+        # of a group are collected as a list of per-chunk arrays.
+        labels = np.zeros(len(mdigests), dtype=np.int64)
+        rows: list[list[npt.NDArray[np.int64]]] = [[]]
+        for start in range(0, len(keys) if len(mdigests) > 0 else 0, chunksize):
+            end = min(start + chunksize, len(keys))
+            missing = self._fill(blocks, keys[start:end], mdigests, results[start:end])
+
+            patterns, pattern = np.unique(missing.T, axis=0, return_inverse=True)
+            combined, labels = np.unique(np.stack([labels, pattern.ravel()]), axis=1, return_inverse=True)
+            labels = labels.ravel()
+            rows = [rows[old] + [np.flatnonzero(patterns[new]) + start] for old, new in combined.T]
+
+        groups = []
+        for label, parts in enumerate(rows):
+            grows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            if len(grows) > 0:
+                groups.append((grows, np.flatnonzero(labels == label).tolist()))
+        return results, groups
+
+    def batch[T: ZeroOrderMotif](
+            self, sequences: Sequence[str], motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs,
+            chunksize: int = 32, backend: Backend | Literal["auto"] = "gemm"
+    ) -> npt.NDArray[np.float32]:
+        """Same as `scoring.batch`, but only (sequence, motif) pairs missing from the cache are scored."""
+        motifs = _compile(motifs)
+
+        # Work with unique sequences only
+        keys, first, inverse = np.unique(digests(sequences), return_index=True, return_inverse=True)
+        mdigests = motifs.digests()
+        results, groups = self.lookup(keys, mdigests)
+
+        for rows, indices in groups:
+            scores = batch(
+                [sequences[i] for i in first[rows]], motifs.select([motifs.ids[i] for i in indices]), chunksize, backend
+            )
+            results[np.ix_(rows, indices)] = scores
+            self.store(keys[rows], [mdigests[i] for i in indices], scores)
+
+        return results[inverse.ravel()]
@@ -0,0 +1,33 @@
+import hashlib
+import os
+from pathlib import Path
+
+from . import parse
+from .motif import CompiledMotifs
+
+
+def jaspar(path: os.PathLike[str], cache: Path | None = None, minic: float | None = None) -> CompiledMotifs:
+    """
+    Load JASPAR PFMs as a compiled collection of HOCOMOCO-style PWMs, optionally trimming flanks with information
+    content below `minic` bits. If `cache` is a directory, the compiled collection is stored there as a binary file
+    keyed by the hash of the source file and the conversion parameters.
+    """
+    path = Path(path)
+    with open(path, 'rb') as stream:
+        key = hashlib.sha256(stream.read())
+    key.update(f"pwm=hocomoco;minic={minic}".encode())
+
+    saveto = None
+    if cache is not None:
+        saveto = cache / f"{path.stem}.{key.hexdigest()[:16]}.npz"
+        if saveto.exists():
+            return CompiledMotifs.load(saveto)
+
+    compiled = parse.jaspar(path).compile()
+    if minic is not None:
+        compiled = compiled.trim(minic)
+    compiled = compiled.to_pwm_hocomoco()
+
+    if saveto is not None:
+        compiled.save(saveto)
+    return compiled
@@ -0,0 +1,99 @@
+from collections.abc import Sequence, Iterator
+from pathlib import Path
+from typing import Self, Literal
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+
+from utils.pkl import atomic_write
+
+from .motif import CompiledMotifs, ZeroOrderMotif, ZeroOrderMotifsCollection
+from .backends import Backend
+from .scoring import _compile, _stack, _responses
+
+
+@define(slots=True, frozen=True)
+class Hits:
+    # Columnar table of motif hits: windows with responses at or above the per-motif threshold
+    region: npt.NDArray[np.uint32]  # Index of the sequence
+    motif: npt.NDArray[np.uint16]  # Index of the motif in the collection
+    offset: npt.NDArray[np.uint32]  # Start of the window in forward strand coordinates
+    strand: npt.NDArray[np.int8]  # 1 - forward, -1 - reverse
+    score: npt.NDArray[np.float32]
+
+    def __len__(self) -> int:
+        return len(self.region)
+
+    def save(self, path: Path):
+        atomic_write(path, lambda stream: np.savez(
+            stream, region=self.region, motif=self.motif, offset=self.offset, strand=self.strand, score=self.score
+        ))
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['region'], data['motif'], data['offset'], data['strand'], data['score'])
+
+    @classmethod
+    def empty(cls) -> Self:
+        return cls(
+            np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint16), np.empty(0, dtype=np.uint32),
+            np.empty(0, dtype=np.int8), np.empty(0, dtype=np.float32)
+        )
+
+    @classmethod
+    def concat(cls, hits: Sequence[Self]) -> Self:
+        if not hits:
+            return cls.empty()
+        columns = ('region', 'motif', 'offset', 'strand', 'score')
+        return cls(*(np.concatenate([getattr(x, name) for x in hits]) for name in columns))
+
+
+def shards(path: Path) -> Iterator[Hits]:
+    for file in sorted(path.glob("hits-*.npz")):
+        yield Hits.load(file)
+
+
+def load(path: Path) -> Hits:
+    return Hits.concat(list(shards(path)))
+
+
+def call[T: ZeroOrderMotif](
+        sequences: Sequence[str], motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs,
+        thresholds: float | npt.NDArray[np.float32], saveto: Path, chunksize: int = 32, shardsize: int = 10_000_000,
+        backend: Backend | Literal["auto"] = "gemm"
+):
+    """Stream all windows with responses at or above the (scalar or per-motif) threshold to `saveto` shards."""
+    motifs = _compile(motifs)
+    if len(sequences) > np.iinfo(np.uint32).max or len(motifs) > np.iinfo(np.uint16).max:
+        raise ValueError("Too many sequences or motifs for the compact hit table")
+
+    matrix, lengths = _stack(motifs), motifs.lengths
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float32), (len(motifs),))
+    thresholds = np.concatenate([thresholds, thresholds])
+
+    # Drop shards from previous runs
+    saveto.mkdir(parents=True, exist_ok=True)
+    for file in saveto.glob("hits-*.npz"):
+        file.unlink()
+
+    buffer, buffered, nshards = [], 0, 0
+    for start in range(0, len(sequences), chunksize):
+        chunk = sequences[start:start + chunksize]
+        responses = _responses(chunk, matrix, lengths, backend)
+
+        region, offset, motif = np.nonzero(responses >= thresholds)
+        hits = Hits(
+            (region + start).astype(np.uint32),
+            (motif % len(motifs)).astype(np.uint16),
+            offset.astype(np.uint32),
+            np.where(motif < len(motifs), 1, -1).astype(np.int8),
+            responses[region, offset, motif]
+        )
+        buffer.append(hits)
+        buffered += len(hits)
+
+        if buffered >= shardsize or start + chunksize >= len(sequences):
+            Hits.concat(buffer).save(saveto / f"hits-{nshards:05d}.npz")
+            buffer, buffered, nshards = [], 0, nshards + 1
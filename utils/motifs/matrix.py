@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import Literal, Self
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+
+
+@define(slots=True, frozen=True)
+class ScoreMatrix:
+    """
+    On-disk (rows x motifs) float32 matrix stored as a plain .npy file and accessed through a memory map, so that
+    matrices larger than memory can be written and read in chunks of rows. Motif IDs and targets are stored next to it.
+    """
+    root: Path
+
+    @property
+    def path(self) -> Path:
+        return self.root / "scores.npy"
+
+    @classmethod
+    def create(cls, root: Path, nrows: int, ids: tuple[str, ...], targets: tuple[str, ...]) -> Self:
+        if len(ids) != len(targets):
+            raise ValueError("IDs and targets must describe the same number of motifs")
+        root.mkdir(parents=True, exist_ok=True)
+        np.savez(root / "motifs.npz", ids=np.array(ids, dtype=str), targets=np.array(targets, dtype=str))
+
+        matrix = cls(root)
+        np.lib.format.open_memmap(matrix.path, mode="w+", dtype=np.float32, shape=(nrows, len(ids))).flush()
+        return matrix
+
+    def scores(self, mode: Literal["r", "r+"] = "r") -> np.memmap:
+        return np.load(self.path, mmap_mode=mode)
+
+    def motifs(self) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        with np.load(self.root / "motifs.npz", allow_pickle=False) as data:
+            return tuple(data['ids'].tolist()), tuple(data['targets'].tolist())
+
+    def chunks(self, chunksize: int) -> list[slice]:
+        nrows = self.scores().shape[0]
+        return [slice(start, min(start + chunksize, nrows)) for start in range(0, nrows, chunksize)]
+
+
+@define(slots=True, frozen=True)
+class Moments:
+    """
+    Per-column count, mean and sum of squared deviations (M2), updated one block of rows at a time with the
+    parallel form of Welford's algorithm (Chan et al.). Stable in float64 for any number of rows.
+    """
+    count: int
+    mean: npt.NDArray[np.float64]
+    m2: npt.NDArray[np.float64]
+
+    @classmethod
+    def empty(cls, ncols: int) -> Self:
+        return cls(0, np.zeros(ncols, dtype=np.float64), np.zeros(ncols, dtype=np.float64))
+
+    def update(self, block: npt.NDArray[np.floating]) -> Self:
+        if block.shape[0] == 0:
+            return self
+        block = np.asarray(block, dtype=np.float64)
+        count = self.count + block.shape[0]
+        mean = block.mean(axis=0)
+        m2 = ((block - mean) ** 2).sum(axis=0)
+
+        delta = mean - self.mean
+        return Moments(
+            count, self.mean + delta * (block.shape[0] / count),
+            self.m2 + m2 + delta ** 2 * (self.count * block.shape[0] / count)
+        )
+
+    def std(self, ddof: int = 1) -> npt.NDArray[np.float64]:
+        if self.count <= ddof:
+            return np.full_like(self.mean, np.nan)
+        return np.sqrt(self.m2 / (self.count - ddof))
@@ -1,10 +1,15 @@
+import hashlib
 from abc import ABC
-from typing import Any
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Self
 
 import numpy as np
 import numpy.typing as npt
 from attrs import define, field
 
+from utils.pkl import atomic_write
+
 
 @define(slots=True, frozen=True)
 class ZeroOrderMotif(ABC):
@@ -31,6 +36,144 @@ class ZeroOrderMotifsCollection[T:ZeroOrderMotif]:
     def __len__(self) -> int:
         return len(self.motifs)
 
+    def compile(self) -> "CompiledMotifs":
+        sizes = {motif.nletters() for motif in self.motifs}
+        if len(sizes) > 1 or (sizes and sizes != {len(self.alphabet)}):
+            raise ValueError(
+                f"All motifs must have the same alphabet size, but got: {sizes} for expected alphabet: {self.alphabet}"
+            )
+
+        lengths = np.array([len(motif) for motif in self.motifs], dtype=np.int64)
+        matrix = np.zeros((len(self.motifs), len(self.alphabet), lengths.max(initial=0)), dtype=np.float32)
+        for padded, motif in zip(matrix, self.motifs):
+            padded[:, :len(motif)] = motif.matrix
+
+        return CompiledMotifs(
+            self.alphabet,
+            tuple(motif.ind for motif in self.motifs),
+            tuple(motif.target for motif in self.motifs),
+            matrix, lengths
+        )
+
+
+@define(slots=True, frozen=True)
+class CompiledMotifs:
+    # Motifs stored as a single zero-padded (motifs x letters x width) tensor, padding columns are always zero
+    alphabet: str
+    ids: tuple[str, ...]
+    targets: tuple[str, ...]
+    matrix: npt.NDArray[np.float32]
+    lengths: npt.NDArray[np.int64]
+
+    def __attrs_post_init__(self):
+        if self.matrix.ndim != 3 or self.matrix.shape[1] != len(self.alphabet):
+            raise ValueError(f"Expected (motifs x {len(self.alphabet)} x width) matrix, got: {self.matrix.shape}")
+        if not (len(self.ids) == len(self.targets) == len(self.lengths) == self.matrix.shape[0]):
+            raise ValueError("IDs, targets, lengths, and matrices must describe the same number of motifs")
+        if np.any(self.matrix[np.broadcast_to(~self.mask()[:, None, :], self.matrix.shape)] != 0):
+            raise ValueError("Padding columns must be zero")
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.matrix.shape[2]
+
+    def select(self, ids: Sequence[str]) -> Self:
+        # Subset of motifs in the given order, padded to the longest selected motif
+        index = {ind: i for i, ind in enumerate(self.ids)}
+        if missing := set(ids) - index.keys():
+            raise ValueError(f"Unknown motifs: {missing}")
+        rows = np.array([index[ind] for ind in ids], dtype=np.int64)
+        lengths = self.lengths[rows]
+        matrix = np.ascontiguousarray(self.matrix[rows][:, :, :lengths.max(initial=0)])
+        return CompiledMotifs(
+            self.alphabet, tuple(self.ids[i] for i in rows), tuple(self.targets[i] for i in rows), matrix, lengths
+        )
+
+    def mask(self) -> npt.NDArray[np.bool_]:
+        # (motifs x width) mask of real (non-padding) columns
+        return np.arange(self.width)[None, :] < self.lengths[:, None]
+
+    def limits(self) -> npt.NDArray[np.float32]:
+        # (motifs x 2) array of the minimum and maximum possible score for each motif
+        return np.stack([self.matrix.min(axis=1).sum(axis=1), self.matrix.max(axis=1).sum(axis=1)], axis=1)
+
+    def revcomp(self) -> Self:
+        if self.alphabet != "ACGT":
+            raise ValueError("Only DNA alphabet (ACGT) is supported")
+        # Reverse letters (A <-> T, C <-> G) and the first `length` columns of each motif, padding stays on the right
+        columns = self.lengths[:, None] - 1 - np.arange(self.width)[None, :]
+        matrix = np.take_along_axis(self.matrix[:, ::-1, :], np.maximum(columns, 0)[:, None, :], axis=2)
+        matrix[np.broadcast_to((columns < 0)[:, None, :], matrix.shape)] = 0
+        return CompiledMotifs(self.alphabet, self.ids, self.targets, matrix, self.lengths)
+
+    def to_pwm_hocomoco(self) -> Self:
+        # Vectorized version of PositionFrequencyMatrix.to_pwm_hocomoco
+        mask = self.mask()[:, None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cnts = self.matrix.sum(axis=1, keepdims=True)
+            pseudocnt = np.log(cnts)
+            matrix = np.log((self.matrix + pseudocnt * 0.25) / ((cnts + pseudocnt) * 0.25))
+        matrix = np.where(mask, matrix, 0).astype(np.float32)
+        return CompiledMotifs(self.alphabet, self.ids, self.targets, matrix, self.lengths)
+
+    def trim(self, minic: float) -> Self:
+        # Trim flanking columns with information content (bits) below `minic`. The matrix must contain counts or
+        # probabilities, motifs without informative columns are left as is.
+        mask = self.mask()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probs = self.matrix / self.matrix.sum(axis=1, keepdims=True)
+            entropy = -np.where(probs > 0, probs * np.log2(probs), 0).sum(axis=1)
+        informative = (np.log2(len(self.alphabet)) - entropy >= minic) & mask
+
+        anyinformative = informative.any(axis=1)
+        first = np.where(anyinformative, informative.argmax(axis=1), 0)
+        last = np.where(anyinformative, self.width - 1 - informative[:, ::-1].argmax(axis=1), self.lengths - 1)
+        lengths = last - first + 1
+
+        columns = first[:, None] + np.arange(self.width)[None, :]
+        matrix = np.take_along_axis(self.matrix, np.minimum(columns, self.width - 1)[:, None, :], axis=2)
+        matrix[np.broadcast_to((columns > last[:, None])[:, None, :], matrix.shape)] = 0
+
+        width = lengths.max(initial=0)
+        return CompiledMotifs(
+            self.alphabet, self.ids, self.targets, np.ascontiguousarray(matrix[:, :, :width]), lengths
+        )
+
+    def digest(self) -> str:
+        hasher = hashlib.sha256()
+        hasher.update(self.alphabet.encode())
+        for ind, target in zip(self.ids, self.targets):
+            hasher.update(f"{ind}\t{target}\n".encode())
+        hasher.update(self.lengths.astype(np.int64).tobytes())
+        hasher.update(np.ascontiguousarray(self.matrix, dtype=np.float32).tobytes())
+        return hasher.hexdigest()
+
+    def digests(self) -> list[str]:
+        # Per-motif digests that depend only on the alphabet and the matrix, i.e. not on IDs or padding
+        digests = []
+        for matrix, length in zip(self.matrix, self.lengths):
+            hasher = hashlib.sha256(self.alphabet.encode())
+            hasher.update(np.ascontiguousarray(matrix[:, :length], dtype=np.float32).tobytes())
+            digests.append(hasher.hexdigest())
+        return digests
+
+    def save(self, path: Path):
+        atomic_write(path, lambda stream: np.savez(
+            stream, alphabet=np.array(self.alphabet), ids=np.array(self.ids, dtype=str),
+            targets=np.array(self.targets, dtype=str), matrix=self.matrix, lengths=self.lengths
+        ))
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                str(data['alphabet']), tuple(data['ids'].tolist()), tuple(data['targets'].tolist()),
+                data['matrix'], data['lengths']
+            )
+
 
 @define(slots=True, frozen=True)
 class PositionWeightMatrix(ZeroOrderMotif):
@@ -0,0 +1,151 @@
+import hashlib
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+
+from utils.pkl import atomic_write
+
+from .motif import CompiledMotifs
+from .quantized import quantize, _codes
+
+# Float32 scores may be off by a fraction of a bin, so that bin edges are matched with a tolerance
+_TOLERANCE = 1e-2
+
+
+@define(slots=True, frozen=True)
+class ScoreDistribution:
+    # Exact distributions of quantized PWM scores under a zero-order background: `sf[k]` is the probability of a
+    # quantized score >= offsets + k (in units of `resolution`) in a random window. Valid for both strands if the
+    # background is symmetric. Quantized scores are sums of rounded columns, they exceed float scores / resolution by
+    # at least `slack`. `maximum` is the highest float score of each motif.
+    ids: tuple[str, ...]
+    offsets: npt.NDArray[np.int64]
+    sf: npt.NDArray[np.float64]
+    slack: npt.NDArray[np.float64]
+    maximum: npt.NDArray[np.float64]
+    resolution: float
+
+    def __len__(self) -> int:
+        return self.sf.shape[0]
+
+    def _bins(self, scores: npt.NDArray[np.float64]) -> npt.NDArray[np.int64]:
+        # The lowest quantized score (relative to offsets) that a finite float score can correspond to
+        bins = np.ceil(scores / self.resolution + self.slack - _TOLERANCE)
+        return bins.astype(np.int64) - self.offsets
+
+    def pvalues(self, scores: npt.NDArray[np.float32]) -> npt.NDArray[np.float64]:
+        # Score -> p-value for a (... x motifs) array of scores. P-values are conservative: reachable scores never
+        # get p = 0.
+        scores = np.asarray(scores, dtype=np.float64)
+        bins = self._bins(np.where(np.isfinite(scores), scores, 0))
+        pvalues = np.take_along_axis(
+            self.sf, np.clip(bins, 0, self.sf.shape[1] - 1).reshape(-1, len(self)).T, axis=1
+        ).T.reshape(bins.shape)
+        pvalues[bins < 0] = 1.0
+        pvalues[bins >= self.sf.shape[1]] = 0.0
+        pvalues[scores == np.inf] = 0.0
+        pvalues[scores == -np.inf] = 1.0
+        pvalues[np.isnan(scores)] = np.nan
+        return pvalues
+
+    def thresholds(self, pvalue: float | npt.NDArray[np.float64]) -> npt.NDArray[np.float32]:
+        # P-value -> the lowest score with P(score >= threshold) <= p-value for each motif. Motifs that can't reach
+        # the requested p-value within their range of scores get an infinite threshold.
+        pvalue = np.broadcast_to(np.asarray(pvalue, dtype=np.float64), (len(self),))
+        highest = self._bins(self.maximum)
+        passed = (self.sf <= pvalue[:, None]) & (np.arange(self.sf.shape[1])[None, :] <= highest[:, None])
+        bins = passed.argmax(axis=1)
+
+        # The lowest float score that maps to the bin, the maximum is the last resort for the highest bin
+        lowest = (self.offsets + bins - 1 + 2 * _TOLERANCE - self.slack) * self.resolution
+        thresholds = np.minimum(lowest, self.maximum).astype(np.float32)
+        thresholds[~passed.any(axis=1)] = np.inf
+        return thresholds
+
+    def save(self, path: Path):
+        atomic_write(path, lambda stream: np.savez(
+            stream, ids=np.array(self.ids, dtype=str), offsets=self.offsets, sf=self.sf, slack=self.slack,
+            maximum=self.maximum, resolution=np.array(self.resolution)
+        ))
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                tuple(data['ids'].tolist()), data['offsets'], data['sf'], data['slack'], data['maximum'],
+                float(data['resolution'])
+            )
+
+
+def _pmf(table: npt.NDArray[np.int64], background: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    # Probability mass function of non-negative integer scores for (motifs x letters x width) table, updated one
+    # column at a time. Only bins that are reachable after the current column are updated. Padding columns are zero
+    # and leave the distribution unchanged.
+    reachable = np.cumsum(table.max(axis=1), axis=1).max(axis=0, initial=0) + 1
+    maxshift = int(table.max(initial=0))
+    nbins = int(reachable.max(initial=1))
+
+    # Left zero padding turns per-motif shifts into row-wise slices of a sliding window view
+    padded = np.zeros((table.shape[0], maxshift + nbins), dtype=np.float64)
+    padded[:, maxshift] = 1.0
+    rows = np.arange(table.shape[0])
+    for column, upto in enumerate(reachable):
+        windows = np.lib.stride_tricks.sliding_window_view(padded[:, :maxshift + upto], upto, axis=1)
+        updated = np.zeros((table.shape[0], upto), dtype=np.float64)
+        for letter, probability in enumerate(background):
+            updated += probability * windows[rows, maxshift - table[:, letter, column]]
+        padded[:, maxshift:maxshift + upto] = updated
+    return padded[:, maxshift:]
+
+
+def distribution(
+        motifs: CompiledMotifs, background: npt.NDArray[np.float64] | None = None, resolution: float = 0.01,
+        cache: Path | None = None, groupsize: int = 64
+) -> ScoreDistribution:
+    """Exact score distributions of all motifs by dynamic programming over quantized scores, optionally cached."""
+    if background is None:
+        background = np.full(len(motifs.alphabet), 1 / len(motifs.alphabet))
+    background = np.asarray(background, dtype=np.float64)
+    if background.shape != (len(motifs.alphabet),) or not np.isclose(background.sum(), 1.0):
+        raise ValueError(f"Background must be a probability vector over {motifs.alphabet}, got: {background}")
+
+    saveto = None
+    if cache is not None:
+        key = hashlib.sha256(motifs.digest().encode())
+        key.update(background.tobytes())
+        key.update(f"resolution={resolution},v2".encode())
+        saveto = cache / f"pvalues.{key.hexdigest()[:16]}.npz"
+        if saveto.exists():
+            return ScoreDistribution.load(saveto)
+
+    # Quantized (motifs x letters x width) scores shifted to be non-negative in each column
+    mapping, vectors = _codes()
+    letters = mapping[np.frombuffer(motifs.alphabet.encode("ASCII"), dtype=np.uint8)]
+    table = quantize(motifs, resolution).table[:, letters, :].astype(np.int64)
+
+    # The smallest total rounding error of any window: the lowest quantized score a float score can correspond to
+    exact = np.einsum('cb,mbw->mcw', vectors[letters].astype(np.float64), motifs.matrix.astype(np.float64))
+    slack = (table - exact / resolution).min(axis=1).sum(axis=1)
+    maximum = exact.max(axis=1).sum(axis=1)
+
+    minimum = table.min(axis=1)
+    table -= minimum[:, None, :]
+    offsets = minimum.sum(axis=1)
+
+    # Motifs with similar score ranges are processed together to avoid updating bins that can't be reached
+    ranges = table.max(axis=1).sum(axis=1)
+    order = np.argsort(ranges)
+    sf = np.zeros((len(motifs), int(ranges.max(initial=0)) + 1), dtype=np.float64)
+    for start in range(0, len(motifs), groupsize):
+        group = order[start:start + groupsize]
+        pmf = _pmf(table[group], background)
+        # Survival function: P(score >= bin)
+        sf[group, :pmf.shape[1]] = np.cumsum(pmf[:, ::-1], axis=1)[:, ::-1]
+    result = ScoreDistribution(motifs.ids, offsets, np.minimum(sf, 1.0), slack, maximum, resolution)
+
+    if saveto is not None:
+        result.save(saveto)
+    return result
@@ -0,0 +1,61 @@
+from functools import cache
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+
+from .motif import CompiledMotifs, ZeroOrderMotif, ZeroOrderMotifsCollection
+from .scoring import _OHE_DNA, _compile
+
+
+@cache
+def _codes() -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.float32]]:
+    # Integer codes for all distinct one-hot vectors, e.g. A, C, G, T, N, and other IUPAC letters.
+    # Code 0 is reserved for unknown letters and encodes a zero vector, same as in the one-hot encoding.
+    ohe = _OHE_DNA().T
+    vectors, codes = np.unique(ohe, axis=0, return_inverse=True)
+    assert not vectors[0].any(), "Zero vector must be the first one"
+    return codes.astype(np.uint8).ravel(), vectors
+
+
+@define(slots=True, frozen=True)
+class QuantizedMotifs:
+    """
+    Motifs quantized to integer multiples of `resolution`. The table stores a score for each motif, letter code, and
+    position, i.e. ambiguous letters are scored exactly as in the one-hot encoding before rounding.
+    """
+    ids: tuple[str, ...]
+    targets: tuple[str, ...]
+    lengths: npt.NDArray[np.int64]
+    table: npt.NDArray[np.int16]  # (motifs x codes x width)
+    revcomp: npt.NDArray[np.int16]  # (motifs x codes x width)
+    resolution: float
+
+    def __len__(self) -> int:
+        return self.table.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.table.shape[2]
+
+    def error(self) -> npt.NDArray[np.float32]:
+        # Upper bound on the absolute difference between quantized and float scores for each motif
+        return (0.5 * self.resolution * self.lengths).astype(np.float32)
+
+
+def quantize[T: ZeroOrderMotif](
+        motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs, resolution: float = 0.01
+) -> QuantizedMotifs:
+    if resolution <= 0:
+        raise ValueError(f"Resolution must be positive, got: {resolution}")
+    motifs = _compile(motifs)
+    _, vectors = _codes()
+
+    tables = []
+    for compiled in motifs, motifs.revcomp():
+        table = np.rint(np.einsum('cb,mbw->mcw', vectors, compiled.matrix) / resolution)
+        if np.abs(table).max(initial=0) > np.iinfo(np.int16).max:
+            raise ValueError(f"Resolution {resolution} is too fine to fit PWM scores into int16")
+        tables.append(table.astype(np.int16))
+    return QuantizedMotifs(motifs.ids, motifs.targets, motifs.lengths, *tables, resolution)
+
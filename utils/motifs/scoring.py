@@ -1,9 +1,17 @@
+from collections.abc import Sequence, Collection
+from functools import cache
+from typing import Literal
+
 import numpy as np
 import numpy.typing as npt
+from attrs import define
 
-from utils.motifs.motif import ZeroOrderMotifsCollection, ZeroOrderMotif
+from utils.motifs import backends
+from utils.motifs.backends import Backend
+from utils.motifs.motif import ZeroOrderMotifsCollection, ZeroOrderMotif, CompiledMotifs
 
 
+@cache
 def _OHE_DNA() -> npt.NDArray[np.float32]:
     mapping = (
         ('A', [0]),
@@ -33,12 +41,12 @@ def _OHE_DNA() -> npt.NDArray[np.float32]:
         for ind in indices:
             ohe[ind, upper] = weight
             ohe[ind, lower] = weight
+    # The table is cached and shared between calls - make sure nobody modifies it
+    ohe.flags.writeable = False
     return ohe
 
 
-def score[T: ZeroOrderMotif](
-        forward: str, revcomp: str, motifs: ZeroOrderMotifsCollection[T]
-) -> list[float]:
+def _validate[T: ZeroOrderMotif](motifs: ZeroOrderMotifsCollection[T]):
     # Check that each motif has the same alphabet size
     sizes = set(motif.nletters() for motif in motifs.motifs)
     if len(sizes) != 1 or sizes != {len(motifs.alphabet)}:
@@ -49,6 +57,12 @@ def score[T: ZeroOrderMotif](
     if motifs.alphabet != "ACGT":
         raise ValueError("Only DNA alphabet (ACGT) is supported")
 
+
+def score[T: ZeroOrderMotif](
+        forward: str, revcomp: str, motifs: ZeroOrderMotifsCollection[T]
+) -> list[float]:
+    _validate(motifs)
+
     # One-hot-encoding
     encoding = _OHE_DNA()
     ohe = []
@@ -78,3 +92,151 @@ def score[T: ZeroOrderMotif](
             float(max(fwdbuffer[:size].max(), revbuffer[:size].max()))
         )
     return results
+
+
+def encode(sequences: Sequence[str], padding: int = 0) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]:
+    """
+    One-hot-encode DNA sequences into a (sequences x positions x letters) array. Sequences are right-padded with
+    zeros to the longest sequence plus `padding` positions. Returns the encoding and the length of each sequence.
+    """
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    maxlen = int(lengths.max(initial=0))
+
+    codes = np.zeros((len(sequences), maxlen + padding), dtype=np.uint8)
+    for row, seq in zip(codes, sequences):
+        row[:len(seq)] = np.frombuffer(seq.encode("ASCII"), dtype=np.uint8)
+
+    # Code 0 is not a letter and maps to a zero vector
+    return _OHE_DNA().T[codes], lengths
+
+
+def _compile[T: ZeroOrderMotif](motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs) -> CompiledMotifs:
+    if isinstance(motifs, ZeroOrderMotifsCollection):
+        _validate(motifs)
+        motifs = motifs.compile()
+    elif motifs.alphabet != "ACGT":
+        raise ValueError("Only DNA alphabet (ACGT) is supported")
+    return motifs
+
+
+def _stack(motifs: CompiledMotifs) -> npt.NDArray[np.float32]:
+    # Reverse complement PWMs score the reverse strand directly on the forward encoding.
+    # Final tensor: (forward motifs + reverse complement motifs) x letters x width
+    return np.ascontiguousarray(np.concatenate([motifs.matrix, motifs.revcomp().matrix]), dtype=np.float32)
+
+
+def _responses(
+        sequences: Sequence[str], matrix: npt.NDArray[np.float32], lengths: npt.NDArray[np.int64],
+        backend: Backend | Literal["auto"] = "gemm"
+) -> npt.NDArray[np.float32]:
+    # Score all windows against all motifs: (sequences x positions x motifs)
+    encoded, seqlens = encode(sequences, padding=matrix.shape[2] - 1)
+    responses = backends.responses(encoded, matrix, backend)
+
+    # Mask windows that extend past the end of the sequence
+    lengths = np.concatenate([lengths, lengths])
+    invalid = np.arange(responses.shape[1])[None, :, None] + lengths[None, None, :] > seqlens[:, None, None]
+    responses[invalid] = -np.inf
+    return responses
+
+
+def profile[T: ZeroOrderMotif](
+        sequence: str, motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs,
+        backend: Backend | Literal["auto"] = "gemm"
+) -> npt.NDArray[np.float32]:
+    """
+    Position-resolved (positions x motifs) responses of a single sequence, maximum over both strands. Position is the
+    start of the window, windows that extend past the end of the sequence are -inf.
+    """
+    motifs = _compile(motifs)
+    responses = _responses([sequence], _stack(motifs), motifs.lengths, backend)[0]
+    return np.maximum(responses[:, :len(motifs)], responses[:, len(motifs):])
+
+
+@define(slots=True, frozen=True)
+class Statistics:
+    """
+    Columnar (sequences x motifs) summaries of motif responses. Statistics that were not requested are None.
+    """
+    # Maximum response over all windows on both strands
+    max: npt.NDArray[np.float32] | None = None
+    # Start of the best window in forward strand coordinates and its strand (1 - forward, -1 - reverse)
+    argmax: npt.NDArray[np.int32] | None = None
+    strand: npt.NDArray[np.int8] | None = None
+    # Log-sum-exp of responses over all windows on both strands
+    occupancy: npt.NDArray[np.float32] | None = None
+    # Number of windows on both strands with responses at or above the threshold
+    hits: npt.NDArray[np.int32] | None = None
+
+
+def _logsumexp(responses: npt.NDArray[np.float32], best: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    # Log-sum-exp over axis 1 given its maximum, -inf if there are no valid windows
+    with np.errstate(invalid='ignore'):
+        shifted = np.exp(responses - best[:, None, :]).sum(axis=1)
+    return np.where(np.isneginf(best), -np.inf, np.log(shifted) + best)
+
+
+Statistic = Literal["max", "argmax", "strand", "occupancy", "hits"]
+
+
+def scan[T: ZeroOrderMotif](
+        sequences: Sequence[str], motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs,
+        statistics: Collection[Statistic] = ("max",), threshold: float | npt.NDArray[np.float32] | None = None,
+        chunksize: int = 32, backend: Backend | Literal["auto"] = "gemm"
+) -> Statistics:
+    """
+    Calculate all requested statistics of motif responses in a single pass over the sequences. The threshold for
+    counting hits is either a scalar or a per-motif array. See `backends.responses` for available backends.
+    """
+    if unknown := set(statistics) - set(Statistic.__args__):
+        raise ValueError(f"Unknown statistics: {unknown}")
+    if "hits" in statistics and threshold is None:
+        raise ValueError("Threshold is required to count hits")
+
+    motifs = _compile(motifs)
+    matrix, lengths = _stack(motifs), motifs.lengths
+    nseqs, nmotifs = len(sequences), len(motifs)
+
+    results = {
+        "max": np.empty((nseqs, nmotifs), dtype=np.float32),
+        "argmax": np.empty((nseqs, nmotifs), dtype=np.int32),
+        "strand": np.empty((nseqs, nmotifs), dtype=np.int8),
+        "occupancy": np.empty((nseqs, nmotifs), dtype=np.float32),
+        "hits": np.empty((nseqs, nmotifs), dtype=np.int32),
+    }
+    results = {k: v for k, v in results.items() if k in statistics}
+
+    for start in range(0, nseqs, chunksize):
+        chunk = sequences[start:start + chunksize]
+        rows = slice(start, start + len(chunk))
+
+        # (sequences x positions * strands x motifs), i.e. both strands are reduced together
+        responses = _responses(chunk, matrix, lengths, backend)
+        responses = responses.reshape(len(chunk), -1, nmotifs)
+
+        best = responses.max(axis=1)
+        if "max" in results:
+            results["max"][rows] = best
+        if "argmax" in results or "strand" in results:
+            ind = responses.argmax(axis=1)
+            if "argmax" in results:
+                results["argmax"][rows] = ind // 2
+            if "strand" in results:
+                results["strand"][rows] = np.where(ind % 2 == 0, 1, -1)
+        if "occupancy" in results:
+            results["occupancy"][rows] = _logsumexp(responses, best)
+        if "hits" in results:
+            results["hits"][rows] = (responses >= np.asarray(threshold, dtype=np.float32)).sum(axis=1)
+    return Statistics(**results)
+
+
+def batch[T: ZeroOrderMotif](
+        sequences: Sequence[str], motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs, chunksize: int = 32,
+        backend: Backend | Literal["auto"] = "gemm"
+) -> npt.NDArray[np.float32]:
+    """
+    Score each sequence against each motif as the maximum response over all windows on both strands. Reverse strand
+    is scored with reverse complement PWMs, i.e. there is no need to pass reverse complement sequences.
+    Returns a (sequences x motifs) float32 matrix.
+    """
+    return scan(sequences, motifs, ("max",), chunksize=chunksize, backend=backend).max
@@ -0,0 +1,111 @@
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import squareform
+
+from utils.pkl import atomic_write
+
+from .motif import CompiledMotifs
+
+
+@define(slots=True, frozen=True)
+class Similarity:
+    # All-vs-all best normalized correlation (Ncor) over offsets and both strands of `b`. `offset[a, b]` is the start
+    # of `b` relative to `a` in the best alignment, `strand[a, b]` is -1 if `b` is reverse complemented.
+    ids: tuple[str, ...]
+    targets: tuple[str, ...]
+    score: npt.NDArray[np.float32]
+    offset: npt.NDArray[np.int32]
+    strand: npt.NDArray[np.int8]
+
+    def __len__(self) -> int:
+        return self.score.shape[0]
+
+    def clusters(self, threshold: float = 0.45) -> npt.NDArray[np.int64]:
+        # Average linkage clustering cut at the given Ncor. Labels start from 0 and are ordered by the cluster size
+        # (largest first), ties are resolved by the first member.
+        if len(self) < 2:
+            return np.zeros(len(self), dtype=np.int64)
+        distance = 1 - np.maximum(self.score, self.score.T).astype(np.float64)
+        np.fill_diagonal(distance, 0)
+        linkage = hierarchy.linkage(squareform(distance, checks=False), method='average')
+        labels = hierarchy.fcluster(linkage, t=1 - threshold, criterion='distance')
+
+        _, first, inverse, counts = np.unique(labels, return_index=True, return_inverse=True, return_counts=True)
+        order = np.lexsort((first, -counts))
+        return np.argsort(order)[inverse]
+
+    def save(self, path: Path):
+        atomic_write(path, lambda stream: np.savez(
+            stream, ids=np.array(self.ids, dtype=str), targets=np.array(self.targets, dtype=str),
+            score=self.score, offset=self.offset, strand=self.strand
+        ))
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                tuple(data['ids'].tolist()), tuple(data['targets'].tolist()), data['score'], data['offset'],
+                data['strand']
+            )
+
+
+def _profiles(motifs: CompiledMotifs) -> npt.NDArray[np.float32]:
+    # Centered and L2-normalized probability columns: dot products between them are Pearson correlations.
+    # Padding and uniform columns become zero vectors.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = motifs.matrix / motifs.matrix.sum(axis=1, keepdims=True)
+        centered = probs - probs.mean(axis=1, keepdims=True)
+        profiles = centered / np.linalg.norm(centered, axis=1, keepdims=True)
+    return np.nan_to_num(profiles, nan=0, posinf=0, neginf=0).astype(np.float32)
+
+
+def similarity(motifs: CompiledMotifs, minoverlap: int = 5, blocksize: int = 128) -> Similarity:
+    """Ncor of all motif pairs (counts or probabilities), alignments overlap by at least `minoverlap` columns."""
+    if motifs.alphabet != "ACGT":
+        raise ValueError("Only DNA alphabet (ACGT) is supported")
+
+    forward, revcomp = _profiles(motifs), _profiles(motifs.revcomp())
+    # Blocks of motifs sorted by length are padded only to their own width. All offsets of a block pair are scored
+    # with a single matrix product over shifted copies.
+    order = np.argsort(motifs.lengths, kind='stable')
+    blocks = [order[i:i + blocksize] for i in range(0, len(order), blocksize)]
+
+    nmotifs, nletters = len(motifs), len(motifs.alphabet)
+    score = np.full((nmotifs, nmotifs), -np.inf, dtype=np.float32)
+    offset = np.zeros((nmotifs, nmotifs), dtype=np.int32)
+    strand = np.ones((nmotifs, nmotifs), dtype=np.int8)
+    for rows in blocks:
+        lrows = motifs.lengths[rows]
+        wrows = int(lrows.max())
+        for cols in blocks:
+            lcols = motifs.lengths[cols]
+            wcols = int(lcols.max())
+
+            # Offset t aligns the first column of `cols` with column t - (wcols - 1) of `rows`
+            padded = np.zeros((len(rows), nletters, wrows + 2 * (wcols - 1)), dtype=np.float32)
+            padded[:, :, wcols - 1:wcols - 1 + wrows] = forward[rows, :, :wrows]
+            shifted = np.lib.stride_tricks.sliding_window_view(padded, wcols, axis=2)
+            shifted = shifted.transpose(2, 0, 1, 3).reshape(-1, nletters * wcols)
+
+            targets = np.concatenate([forward[cols, :, :wcols], revcomp[cols, :, :wcols]]).reshape(2 * len(cols), -1)
+            sums = (shifted @ targets.T).reshape(-1, len(rows), 2, len(cols))
+
+            # Alignment geometry for each (offset x rows x cols)
+            shifts = np.arange(sums.shape[0])[:, None, None] - (wcols - 1)
+            overlap = np.minimum(lrows[None, :, None], lcols[None, None, :] + shifts) - np.maximum(shifts, 0)
+            union = lrows[None, :, None] + lcols[None, None, :] - overlap
+            enough = overlap >= np.minimum(minoverlap, np.minimum(lrows[:, None], lcols[None, :]))[None]
+
+            ncor = np.where(enough[:, :, None, :], sums / union[:, :, None, :], -np.inf)
+            ncor = ncor.transpose(1, 3, 0, 2).reshape(len(rows), len(cols), -1)
+            best = ncor.argmax(axis=2)
+
+            score[np.ix_(rows, cols)] = np.take_along_axis(ncor, best[:, :, None], axis=2)[:, :, 0]
+            offset[np.ix_(rows, cols)] = best // 2 - (wcols - 1)
+            strand[np.ix_(rows, cols)] = np.where(best % 2 == 0, 1, -1)
+    return Similarity(motifs.ids, motifs.targets, score, offset, strand)
@@ -0,0 +1,91 @@
+from collections.abc import Sequence
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+from attrs import define
+
+from .backends import Backend
+from .motif import CompiledMotifs, ZeroOrderMotif, ZeroOrderMotifsCollection
+from .scoring import Statistics, _compile, _stack, _responses, _logsumexp
+
+
+@define(slots=True, frozen=True)
+class Effects:
+    """
+    Motif responses of reference and alternative alleles, restricted to windows overlapping each variant. Both are
+    (variants x motifs) statistics with `max` and `occupancy` fields.
+    """
+    ref: Statistics
+    alt: Statistics
+
+    def delta_max(self) -> npt.NDArray[np.float32]:
+        return self.alt.max - self.ref.max
+
+    def delta_occupancy(self) -> npt.NDArray[np.float32]:
+        return self.alt.occupancy - self.ref.occupancy
+
+
+def _local(
+        sequence: str, offset: int, ref: str, alt: str, context: int
+) -> tuple[str, str, int]:
+    if sequence[offset:offset + len(ref)].upper() != ref.upper():
+        raise ValueError(f"Reference allele {ref} doesn't match the sequence at {offset}")
+    start = max(0, offset - context)
+    end = min(len(sequence), offset + len(ref) + context)
+    return sequence[start:end], sequence[start:offset] + alt + sequence[offset + len(ref):end], offset - start
+
+
+def _overlapping(
+        sequences: Sequence[str], starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64],
+        matrix: npt.NDArray[np.float32], lengths: npt.NDArray[np.int64], backend: Backend | Literal["auto"]
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.float32]]:
+    responses = _responses(sequences, matrix, lengths, backend)
+
+    # Keep only windows overlapping [start, end). For deletions (start == end), these are windows spanning the junction.
+    lengths = np.concatenate([lengths, lengths])[None, None, :]
+    position = np.arange(responses.shape[1])[None, :, None]
+    overlaps = (position > starts[:, None, None] - lengths) & (position < ends[:, None, None])
+    responses[~overlaps] = -np.inf
+
+    responses = responses.reshape(len(sequences), -1, matrix.shape[0] // 2)
+    best = responses.max(axis=1)
+    return best, _logsumexp(responses, best)
+
+
+def effects[T: ZeroOrderMotif](
+        sequences: Sequence[str], region: npt.NDArray[np.int64], offset: npt.NDArray[np.int64],
+        ref: Sequence[str], alt: Sequence[str], motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs,
+        chunksize: int = 256, backend: Backend | Literal["auto"] = "gemm"
+) -> Effects:
+    """
+    Score SNPs and indels given as (region index, 0-based offset, ref allele, alt allele). For each variant, only
+    windows overlapping the variant are scanned on both alleles, all variants in a chunk are scored together.
+    """
+    if not (len(region) == len(offset) == len(ref) == len(alt)):
+        raise ValueError("Region, offset, ref, and alt must describe the same number of variants")
+    motifs = _compile(motifs)
+    matrix, lengths = _stack(motifs), motifs.lengths
+
+    shape = (len(region), len(motifs))
+    refmax, refocc = np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32)
+    altmax, altocc = np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32)
+    for start in range(0, len(region), chunksize):
+        rows = slice(start, start + chunksize)
+
+        # Local sequences with enough context for all windows overlapping the variant
+        local = [
+            _local(sequences[reg], off, r, a, motifs.width - 1)
+            for reg, off, r, a in zip(region[rows], offset[rows], ref[rows], alt[rows])
+        ]
+        starts = np.array([x[2] for x in local], dtype=np.int64)
+        reflen = np.fromiter((len(x) for x in ref[rows]), dtype=np.int64, count=len(local))
+        altlen = np.fromiter((len(x) for x in alt[rows]), dtype=np.int64, count=len(local))
+
+        refmax[rows], refocc[rows] = _overlapping(
+            [x[0] for x in local], starts, starts + reflen, matrix, lengths, backend
+        )
+        altmax[rows], altocc[rows] = _overlapping(
+            [x[1] for x in local], starts, starts + altlen, matrix, lengths, backend
+        )
+    return Effects(Statistics(max=refmax, occupancy=refocc), Statistics(max=altmax, occupancy=altocc))
@@ -0,0 +1,113 @@
+from collections.abc import Sequence
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+
+from .backends import Backend
+from .motif import CompiledMotifs, ZeroOrderMotif, ZeroOrderMotifsCollection
+from .scoring import _compile, _responses, _stack
+
+
+def merge(
+        seqids: Sequence[str], starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64]
+) -> tuple[npt.NDArray[np.int64], list[str], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Merge overlapping windows on the same contig into spans. Windows that only touch each other are not merged.
+    Returns the span index of each window and the seqid, start and end of each span.
+    """
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    contigs, codes = np.unique(np.asarray(seqids, dtype=str), return_inverse=True)
+    order = np.lexsort((starts, codes))
+
+    # A new span starts at every window that doesn't overlap the furthest end seen so far on its contig
+    scodes, sstarts, sends = codes[order], starts[order], ends[order]
+    newcontig = np.ones(len(order), dtype=np.bool_)
+    newcontig[1:] = scodes[1:] != scodes[:-1]
+    # Running maximum of ends restarts on every contig: later contigs are offset so that earlier ends never dominate
+    offset = np.cumsum(newcontig) * (int(ends.max(initial=0)) + 1)
+    reach = np.maximum.accumulate(sends + offset) - offset
+    newspan = newcontig.copy()
+    newspan[1:] |= sstarts[1:] >= reach[:-1]
+
+    spanids = np.empty(len(order), dtype=np.int64)
+    spanids[order] = np.cumsum(newspan) - 1
+
+    first = np.flatnonzero(newspan)
+    spanseqids = [str(contigs[c]) for c in scodes[first]]
+    spanstarts = sstarts[first]
+    spanends = np.maximum.reduceat(sends, first) if len(first) > 0 else np.empty(0, dtype=np.int64)
+    return spanids, spanseqids, spanstarts, spanends
+
+
+def _stitch(
+        sequences: Sequence[str], offsets: npt.NDArray[np.int64], spanids: npt.NDArray[np.int64],
+        lengths: npt.NDArray[np.int64]
+) -> list[str]:
+    # Rebuild each span from the windows it covers. Windows are slices of the same genome, so any overlapping
+    # windows agree on the shared bases.
+    buffers = [bytearray(length) for length in lengths]
+    for seq, offset, span in zip(sequences, offsets, spanids):
+        buffers[span][offset:offset + len(seq)] = seq.encode("ASCII")
+    return [buffer.decode("ASCII") for buffer in buffers]
+
+
+def batch[T: ZeroOrderMotif](
+        seqids: Sequence[str], starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64], sequences: Sequence[str],
+        motifs: ZeroOrderMotifsCollection[T] | CompiledMotifs, chunklen: int = 12_288,
+        backend: Backend | Literal["auto"] = "gemm"
+) -> npt.NDArray[np.float32]:
+    """
+    Same as `scoring.batch` for genomic windows, but overlapping windows are merged and each merged span is scanned
+    once. The score of every window is then a range maximum over the responses of its span. Spans are scored in
+    chunks of at most `chunklen` padded positions (a longer span is scored on its own).
+    """
+    motifs = _compile(motifs)
+    matrix, mlengths = _stack(motifs), motifs.lengths
+    nmotifs = len(motifs)
+
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    if np.any(ends - starts != np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))):
+        raise ValueError("Window sequences must match window coordinates")
+
+    spanids, _, spanstarts, spanends = merge(seqids, starts, ends)
+    offsets = starts - spanstarts[spanids]
+    spans = _stitch(sequences, offsets, spanids, spanends - spanstarts)
+
+    # All motifs fit into a window at the first `head` starts. For the remaining starts, windows of the same length
+    # share the (starts x stacked motifs) mask of motifs that still fit.
+    wlengths = ends - starts
+    minlen, maxlen = int(mlengths.min()), int(mlengths.max())
+    tails = {}
+    for wlen in np.unique(wlengths).tolist():
+        head = max(wlen - maxlen + 1, 0)
+        positions = np.arange(head, wlen - minlen + 1)
+        tails[wlen] = (head, positions[:, None] <= wlen - np.concatenate([mlengths, mlengths])[None, :])
+
+    # Similar spans are processed together to minimize padding. Chunks are capped by the number of spans times the
+    # longest one, i.e. by the size of the padded response tensor.
+    results = np.empty((len(starts), nmotifs), dtype=np.float32)
+    order = np.argsort(spanends - spanstarts, kind='stable')
+    chunks, first = [], 0
+    for last, length in enumerate((spanends - spanstarts)[order].tolist()):
+        if last > first and (last - first + 1) * length > chunklen:
+            chunks.append(order[first:last])
+            first = last
+    if first < len(order):
+        chunks.append(order[first:])
+
+    windows = np.argsort(spanids, kind='stable')
+    bounds = np.searchsorted(spanids[windows], np.arange(len(spans) + 1))
+    for chunk in chunks:
+        responses = _responses([spans[i] for i in chunk], matrix, mlengths, backend)
+
+        # Range maximum of each window over the shared span responses
+        for row, span in enumerate(chunk):
+            for window in windows[bounds[span]:bounds[span + 1]]:
+                head, fits = tails[int(wlengths[window])]
+                tail = responses[row, offsets[window] + head:offsets[window] + head + len(fits)]
+                best = np.where(fits, tail, -np.inf).max(axis=0, initial=-np.inf)
+                if head > 0:
+                    best = np.maximum(best, responses[row, offsets[window]:offsets[window] + head].max(axis=0))
+                results[window] = np.maximum(best[:nmotifs], best[nmotifs:])
+    return results
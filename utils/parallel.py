@@ -0,0 +1,21 @@
+import sys
+from contextlib import AbstractContextManager, nullcontext
+from typing import Literal
+
+from threadpoolctl import threadpool_limits
+
+
+def freethreading() -> bool:
+    # True for free-threaded (no-GIL) interpreters with the GIL actually disabled at runtime
+    return not getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+def backend() -> Literal["threading", "loky"]:
+    # Threads share read-only data without pickling and copying, but they scale only without the GIL
+    return "threading" if freethreading() else "loky"
+
+
+def limits() -> AbstractContextManager:
+    # Thread workers run their own BLAS calls, limit BLAS to a single thread to avoid oversubscription.
+    # Process workers are limited by joblib itself.
+    return threadpool_limits(1) if backend() == "threading" else nullcontext()
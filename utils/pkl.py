@@ -1,6 +1,23 @@
+import os
 import pickle
+import tempfile
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import IO
+
+
+def atomic_write(path: Path, writer: Callable[[IO[bytes]], None]):
+    # Write to a unique temporary file in the same directory, then rename it to avoid corrupting existing data
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            writer(stream)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
 
 
 @dataclass(frozen=True)
@@ -12,14 +29,4 @@ class PklData[T]:
             return pickle.load(stream)
 
     def dump(self, data: T):
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-
-        # First - dump to a temporary file to avoid corrupting existing data
-        tmp_path = self.path.with_suffix(".pkl.tmp")
-        with open(tmp_path, 'wb') as stream:
-            pickle.dump(data, stream, protocol=pickle.HIGHEST_PROTOCOL)
-
-        # Then - rename the temporary file to the original file
-        if self.path.exists():
-            self.path.unlink()
-        tmp_path.rename(self.path)
+        atomic_write(self.path, lambda stream: pickle.dump(data, stream, protocol=pickle.HIGHEST_PROTOCOL))
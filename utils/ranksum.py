@@ -0,0 +1,232 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+from scipy import sparse, special, stats
+
+
+@dataclass(frozen=True)
+class RankSum:
+    """
+    Two-sided Mann-Whitney U tests of a single vector of values between pairs of groups, one test per column of the
+    group masks. `u` is the statistic of the first group, deltas are first group minus the second one. Tests with an
+    empty group are NaN.
+    """
+    n1: npt.NDArray[np.int64]
+    n2: npt.NDArray[np.int64]
+    u: npt.NDArray[np.float64]
+    pvalue: npt.NDArray[np.float64]
+    mean_delta: npt.NDArray[np.float64]
+    median_delta: npt.NDArray[np.float64]
+
+
+def _ties(values: npt.NDArray[np.float64]) -> tuple[npt.NDArray[np.float64], sparse.csr_array]:
+    # Sorted unique values and a sparse (unique values x values) indicator. Multiplying masks by the indicator counts
+    # group members per unique value, i.e. the values are ranked only once for all tests.
+    unique, codes = np.unique(values, return_inverse=True)
+    indicator = sparse.csr_array(
+        (np.ones(len(values)), (codes, np.arange(len(values)))), shape=(len(unique), len(values))
+    )
+    return unique, indicator
+
+
+def _medians(unique: npt.NDArray[np.float64], counts: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    # Median of each column given the number of its members at each unique value (ascending)
+    total = counts.sum(axis=0)
+    cumulative = np.cumsum(counts, axis=0)
+
+    # Index of the first unique value where the cumulative count exceeds the k-th (0-based) order statistic
+    lo = (cumulative <= ((total - 1) // 2)[None, :]).sum(axis=0)
+    hi = (cumulative <= (total // 2)[None, :]).sum(axis=0)
+    lo, hi = np.minimum(lo, len(unique) - 1), np.minimum(hi, len(unique) - 1)
+    return np.where(total > 0, (unique[lo] + unique[hi]) / 2, np.nan)
+
+
+def mannwhitneyu(
+        values: npt.NDArray[np.floating], first: npt.NDArray[np.bool_], second: npt.NDArray[np.bool_]
+) -> RankSum:
+    """
+    Test `values[first[:, j]]` against `values[second[:, j]]` for every column j of the (values x tests) masks.
+    Groups may overlap and don't have to cover all values. P-values are identical to `scipy.stats.mannwhitneyu`
+    with default arguments: the tie-corrected normal approximation with continuity correction, or the exact
+    distribution (computed with scipy) for small groups without ties.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if first.shape != second.shape or first.ndim != 2 or first.shape[0] != len(values):
+        raise ValueError(f"Expected two ({len(values)} x tests) masks, got: {first.shape} and {second.shape}")
+
+    unique, indicator = _ties(values)
+    first, second = np.asarray(first, dtype=np.float64), np.asarray(second, dtype=np.float64)
+    counts1, counts2 = indicator @ first, indicator @ second
+    n1, n2 = counts1.sum(axis=0), counts2.sum(axis=0)
+
+    # U of the first group: second group values below each first group value, ties count as one half
+    below = np.cumsum(counts2, axis=0) - counts2
+    u1 = (counts1 * (below + 0.5 * counts2)).sum(axis=0)
+    u = np.maximum(u1, n1 * n2 - u1)
+
+    # Tie-corrected normal approximation with continuity correction (same as scipy)
+    n = n1 + n2
+    tied = counts1 + counts2
+    tieterm = (tied ** 3 - tied).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tieterm / (n * (n - 1))))
+        z = (u - n1 * n2 / 2 - 0.5) / s
+    pvalue = np.clip(2 * special.ndtr(-z), 0, 1)
+
+    # Small groups without ties use the exact distribution
+    for j in np.flatnonzero((np.minimum(n1, n2) <= 8) & (n1 > 0) & (n2 > 0) & (tieterm == 0)):
+        pvalue[j] = stats.mannwhitneyu(values[first[:, j] > 0], values[second[:, j] > 0]).pvalue
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_delta = (values @ first) / n1 - (values @ second) / n2
+    median_delta = _medians(unique, counts1) - _medians(unique, counts2)
+
+    empty = (n1 == 0) | (n2 == 0)
+    u1[empty], pvalue[empty] = np.nan, np.nan
+    return RankSum(n1.astype(np.int64), n2.astype(np.int64), u1, pvalue, mean_delta, median_delta)
+
+
+def _prefix(values: npt.NDArray[np.floating]) -> npt.NDArray[np.float64]:
+    # Sums of the first 0, 1, ..., n elements along the last axis
+    prefix = np.zeros((*values.shape[:-1], values.shape[-1] + 1))
+    np.cumsum(values, axis=-1, out=prefix[..., 1:])
+    return prefix
+
+
+@dataclass(frozen=True)
+class Sweep:
+    """
+    Mann-Whitney U tests for a grid of (lower, upper) score thresholds. Arrays are (lower x upper x tests): the first
+    group has scores >= upper, the second one has scores <= lower. Grid points where groups overlap or are empty
+    are NaN (counts are still reported).
+    """
+    lower: npt.NDArray[np.float64]
+    upper: npt.NDArray[np.float64]
+    n1: npt.NDArray[np.int64]
+    n2: npt.NDArray[np.int64]
+    u: npt.NDArray[np.float64]
+    pvalue: npt.NDArray[np.float64]
+    mean_delta: npt.NDArray[np.float64]
+
+
+def sweep(
+        values: npt.NDArray[np.floating], scores: npt.NDArray[np.floating], lower: Sequence[float],
+        upper: Sequence[float]
+) -> Sweep:
+    """
+    Same tests as `mannwhitneyu` for every (lower, upper) pair and every column of the (values x tests) scores.
+    Values are ranked once. For each test and lower threshold, values are ordered by decreasing score and the first
+    group grows one value at a time: U, tie terms and sums are cumulative along this order, so all upper
+    thresholds are evaluated in a single pass.
+    """
+    values, scores = np.asarray(values, dtype=np.float64), np.asarray(scores, dtype=np.float64)
+    lower, upper = np.asarray(lower, dtype=np.float64), np.asarray(upper, dtype=np.float64)
+    if scores.ndim != 2 or scores.shape[0] != len(values):
+        raise ValueError(f"Expected ({len(values)} x tests) scores, got: {scores.shape}")
+
+    _, codes = np.unique(values, return_inverse=True)
+    nunique = int(codes.max(initial=-1)) + 1
+
+    shape = (len(lower), len(upper), scores.shape[1])
+    n1, n2 = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+    u1, tieterm, mean_delta = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    for col in range(scores.shape[1]):
+        order = np.argsort(-scores[:, col], kind='stable')
+        descending = scores[order, col]
+        # Size of the first group (a prefix of the order) for each upper threshold
+        sizes = np.searchsorted(-descending, -upper, side='right')
+        vcodes, vsorted = codes[order], values[order]
+        sums1 = _prefix(vsorted)
+
+        # Number of earlier values in the order with the same value
+        byvalue = np.argsort(vcodes, kind='stable')
+        starts = np.searchsorted(vcodes[byvalue], vcodes[byvalue], side='left')
+        before = np.empty(len(order), dtype=np.int64)
+        before[byvalue] = np.arange(len(order)) - starts
+
+        # Second groups for all lower thresholds at once: (lower x values)
+        second = scores[None, :, col] <= lower[:, None]
+        n1[:, :, col], n2[:, :, col] = sizes[None, :], second.sum(axis=1)[:, None]
+        rows, cols = np.nonzero(second)
+        counts2 = np.bincount(rows * nunique + codes[cols], minlength=len(lower) * nunique)
+        counts2 = counts2.reshape(len(lower), nunique).astype(np.float64)
+
+        # Second group values strictly below each value, ties count as one half
+        below = np.cumsum(counts2, axis=1) - counts2
+        ranks = below[:, vcodes] + 0.5 * counts2[:, vcodes]
+        u1[:, :, col] = _prefix(ranks)[:, sizes]
+
+        # Adding a value to a tie of size t increases sum(t^3 - t) by 3t^2 + 3t
+        tied = counts2[:, vcodes] + before[None, :]
+        initial = (counts2 ** 3 - counts2).sum(axis=1, keepdims=True)
+        tieterm[:, :, col] = initial + _prefix(3 * tied ** 2 + 3 * tied)[:, sizes]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean2 = (second @ values) / n2[:, 0, col]
+            mean_delta[:, :, col] = (sums1[sizes] / sizes)[None, :] - mean2[:, None]
+
+    # Groups must be disjoint
+    overlap = upper[None, :] <= lower[:, None]
+    u1[overlap], mean_delta[overlap] = np.nan, np.nan
+
+    n1f, n2f = n1.astype(np.float64), n2.astype(np.float64)
+    n = n1f + n2f
+    u = np.maximum(u1, n1f * n2f - u1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sqrt(n1f * n2f / 12 * ((n + 1) - tieterm / (n * (n - 1))))
+        z = (u - n1f * n2f / 2 - 0.5) / s
+    pvalue = np.clip(2 * special.ndtr(-z), 0, 1)
+
+    empty = (n1 == 0) | (n2 == 0) | np.isnan(u1)
+    u1[empty], pvalue[empty], mean_delta[empty] = np.nan, np.nan, np.nan
+
+    # Small groups without ties use the exact distribution
+    for i, j, col in zip(*np.nonzero(~empty & (np.minimum(n1, n2) <= 8) & (tieterm == 0))):
+        first, second = scores[:, col] >= upper[j], scores[:, col] <= lower[i]
+        pvalue[i, j, col] = stats.mannwhitneyu(values[first], values[second]).pvalue
+    return Sweep(lower, upper, n1, n2, u1, pvalue, mean_delta)
+
+
+def permutations(
+        values: npt.NDArray[np.floating], first: npt.NDArray[np.bool_], second: npt.NDArray[np.bool_],
+        strata: npt.NDArray | None = None, count: int = 10_000, batchsize: int = 256, seed: int = 0
+) -> npt.NDArray[np.float64]:
+    """
+    Two-sided empirical p-values for every column of the (values x tests) masks. Values are shuffled within strata
+    (all together if `strata` is None) and the statistic is the difference of mean ranks between the first and the
+    second group, ranks are computed once over all values. A batch of permutations is scored for all tests with a
+    single matrix product. For a fixed seed results don't depend on the batch size. Tests with an empty group are NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if first.shape != second.shape or first.ndim != 2 or first.shape[0] != len(values):
+        raise ValueError(f"Expected two ({len(values)} x tests) masks, got: {first.shape} and {second.shape}")
+
+    first, second = np.asarray(first, dtype=np.float64), np.asarray(second, dtype=np.float64)
+    n1, n2 = first.sum(axis=0), second.sum(axis=0)
+    empty = (n1 == 0) | (n2 == 0)
+
+    # Difference of mean ranks scaled by 2 * n1 * n2: doubled mid-ranks and the contrast are integers, so all
+    # statistics are exact in float64 and ties with the observed value are counted correctly
+    contrast = first * n2 - second * n1
+    ranks = 2 * stats.rankdata(values)
+    observed = np.abs(ranks @ contrast)
+
+    # Strata occupy consecutive blocks after sorting. Random keys in [0, 0.5) offset by the stratum code shuffle
+    # each block within itself.
+    codes = np.zeros(len(values), dtype=np.int64) if strata is None else np.unique(strata, return_inverse=True)[1]
+    base = np.argsort(codes, kind='stable')
+    offsets = codes[base].astype(np.float64)
+
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(first.shape[1], dtype=np.int64)
+    for start in range(0, count, batchsize):
+        size = min(batchsize, count - start)
+        shuffled = np.empty((size, len(values)))
+        shuffled[:, base] = ranks[base[np.argsort(rng.random((size, len(values))) / 2 + offsets, axis=1)]]
+        exceed += (np.abs(shuffled @ contrast) >= observed).sum(axis=0)
+
+    pvalue = (exceed + 1) / (count + 1)
+    pvalue[empty] = np.nan
+    return pvalue
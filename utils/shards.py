@@ -0,0 +1,71 @@
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from .pkl import atomic_write
+
+
+@dataclass(frozen=True)
+class Shards:
+    # Row blocks of a 2D array saved as separate files with a manifest of completed row ranges, so that interrupted
+    # runs can continue. Shards saved for a different key (i.e. other inputs) are discarded.
+    root: Path = field(default_factory=Path)
+    key: str = ""
+
+    @property
+    def manifest(self) -> Path:
+        return self.root / "manifest.json"
+
+    def _shard(self, start: int, end: int) -> Path:
+        return self.root / f"rows-{start:010d}-{end:010d}.npy"
+
+    def _completed(self) -> list[tuple[int, int]]:
+        if not self.manifest.exists():
+            return []
+        with open(self.manifest) as stream:
+            manifest = json.load(stream)
+        if manifest["key"] != self.key:
+            return []
+        return [(start, end) for start, end in manifest["completed"]]
+
+    def resume(self) -> set[tuple[int, int]]:
+        # Completed (start, end) row ranges. Shards from runs with other inputs are removed.
+        completed = self._completed()
+        if not completed:
+            self.clear()
+        return set(completed)
+
+    def clear(self):
+        for path in self.root.glob("rows-*.npy"):
+            path.unlink()
+        self.manifest.unlink(missing_ok=True)
+
+    def store(self, start: int, end: int, block: npt.NDArray):
+        if block.shape[0] != end - start:
+            raise ValueError(f"Expected {end - start} rows for the shard [{start}, {end}), got: {block.shape[0]}")
+        # The manifest is updated only after the shard is saved
+        atomic_write(self._shard(start, end), lambda stream: np.save(stream, block))
+        completed = sorted(set(self._completed()) | {(start, end)})
+        manifest = json.dumps({"key": self.key, "completed": completed}).encode()
+        atomic_write(self.manifest, lambda stream: stream.write(manifest))
+
+    def load(self, start: int, end: int) -> npt.NDArray:
+        return np.load(self._shard(start, end))
+
+    def merge(self, nrows: int, out: npt.NDArray | None = None) -> npt.NDArray:
+        # Assemble all shards into a single array (optionally a pre-allocated one, e.g. a memory map). Shards must
+        # cover all rows exactly once.
+        completed = sorted(self._completed())
+        if not completed or completed[0][0] != 0 or completed[-1][1] != nrows or \
+                any(end != start for (_, end), (start, _) in zip(completed[:-1], completed[1:])):
+            raise ValueError(f"Shards don't cover all {nrows} rows: {completed}")
+
+        for start, end in completed:
+            block = self.load(start, end)
+            if out is None:
+                out = np.empty((nrows, *block.shape[1:]), dtype=block.dtype)
+            out[start:end] = block
+        return out